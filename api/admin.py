@@ -7,6 +7,15 @@ admin.site.register(CustomUser)
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
     list_display = ['id', 'name', 'is_visible']
+    actions = ['soft_delete_projects', 'restore_projects']
+
+    @admin.action(description='Soft delete selected projects with their roles and comments')
+    def soft_delete_projects(self, request, queryset):
+        Project.bulk_soft_delete(list(queryset.values_list('pk', flat=True)))
+
+    @admin.action(description='Restore selected projects with their roles and comments')
+    def restore_projects(self, request, queryset):
+        Project.bulk_restore(list(queryset.values_list('pk', flat=True)))
 
 @admin.register(ProjectRole)
 class ProjectRoleAdmin(admin.ModelAdmin):
@@ -0,0 +1,167 @@
+"""
+Archival of the rows hidden by soft deletes.
+
+`archive_hidden_rows` moves the projects, project roles and comments hidden
+for longer than `settings.API_ARCHIVE_AFTER_DAYS` out of the tables in
+batches. Each batch is appended to a gzipped JSON Lines file under
+`settings.API_ARCHIVE_DIR` (Django's `jsonl` format, so `manage.py loaddata`
+restores it) and then deleted in one transaction. Roles and comments go
+before their project: those of an archived project are archived with it,
+whatever their own visibility.
+
+A checkpoint file records the batch written but not deleted yet, so a run
+interrupted in between finishes the deletion on the next run instead of
+archiving the rows twice. Runs do not overlap and stop after `max_batches`,
+so the job can be scheduled as often as needed.
+"""
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import serializers
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .authorization import invalidate_project_roles
+from .caching import bump_generation
+from .models import Project, ProjectRole, Comment, ProjectSummary
+from .search import get_search_index
+
+LOCK_KEY = 'archive-hidden-rows'
+LOCK_TIMEOUT = 60 * 60
+
+
+class ArchiveInProgress(Exception):
+    pass
+
+
+def get_archive_horizon():
+    """
+    Rows hidden before this moment may have been archived.
+    """
+    return timezone.now() - timedelta(days=settings.API_ARCHIVE_AFTER_DAYS)
+
+
+def get_archivable_querysets(horizon, using='default'):
+    """
+    `[(model, queryset)]` of the rows to archive, children first.
+    """
+    hidden = Q(is_visible=False, updated_at__lt=horizon)
+    project_hidden = Q(project__is_visible=False, project__updated_at__lt=horizon)
+    return [
+        (Comment, Comment.objects.using(using).filter(hidden | project_hidden)),
+        (ProjectRole, ProjectRole.objects.using(using).filter(hidden | project_hidden)),
+        (Project, Project.objects.using(using).filter(hidden)),
+    ]
+
+
+class ColdStore:
+    """
+    The archive files and the checkpoint, in `directory`.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.checkpoint_path = os.path.join(directory, 'checkpoint.json')
+
+    def get_path(self, model):
+        return os.path.join(self.directory, model._meta.label_lower, f'{timezone.now():%Y-%m-%d}.jsonl.gz')
+
+    def write(self, model, rows):
+        path = self.get_path(model)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = serializers.serialize('jsonl', rows)
+        # every batch is a gzip member of its own; readers see one stream
+        with open(path, 'ab') as f:
+            with gzip.GzipFile(fileobj=f, mode='ab') as gz:
+                gz.write(data.encode())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_checkpoint(self, model, pks):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = self.checkpoint_path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump({'model': model._meta.label_lower, 'pks': [str(pk) for pk in pks]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+
+def delete_rows(model, pks, using='default'):
+    """
+    Delete `pks` of `model` with set-based statements. The post_delete
+    receivers would load and handle the rows one by one, so their side
+    effects are applied here for the whole batch.
+    """
+    with transaction.atomic(using=using):
+        if model is Project:
+            invalidate_project_roles(Project.objects.using(using).filter(pk__in=pks).values_list('created_by_id', 'pk'))
+            ProjectSummary.objects.using(using).filter(project_id__in=pks)._raw_delete(using)
+        elif model is ProjectRole:
+            invalidate_project_roles(ProjectRole.objects.using(using).filter(pk__in=pks).values_list('user_id', 'project_id'))
+
+        index = get_search_index(model)
+        if index is not None:
+            index.delete(pks, using=using)
+        count = model.objects.using(using).filter(pk__in=pks)._raw_delete(using)
+    bump_generation(model, using=using)
+    return count
+
+
+def archive_hidden_rows(store=None, batch_size=1000, max_batches=None, dry_run=False, using='default'):
+    """
+    Archive the rows hidden before the archive horizon and return the number
+    archived per model label (the number archivable with `dry_run`).
+    """
+    store = store or ColdStore(settings.API_ARCHIVE_DIR)
+    horizon = get_archive_horizon()
+    if dry_run:
+        return {model._meta.label_lower: queryset.count() for model, queryset in get_archivable_querysets(horizon, using)}
+
+    if not cache.add(LOCK_KEY, True, timeout=LOCK_TIMEOUT):
+        raise ArchiveInProgress('Another archive run is in progress.')
+    try:
+        counts = {}
+        checkpoint = store.read_checkpoint()
+        if checkpoint is not None:
+            # written by an interrupted run, not deleted yet
+            model = next(model for model, queryset in get_archivable_querysets(horizon, using)
+                         if model._meta.label_lower == checkpoint['model'])
+            counts[checkpoint['model']] = delete_rows(model, checkpoint['pks'], using=using)
+            store.clear_checkpoint()
+
+        batches = 0
+        for model, queryset in get_archivable_querysets(horizon, using):
+            label = model._meta.label_lower
+            counts.setdefault(label, 0)
+            while max_batches is None or batches < max_batches:
+                rows = list(queryset.order_by('updated_at', 'pk')[:batch_size])
+                if not rows:
+                    break
+                pks = [row.pk for row in rows]
+                store.write(model, rows)
+                store.write_checkpoint(model, pks)
+                counts[label] += delete_rows(model, pks, using=using)
+                store.clear_checkpoint()
+                batches += 1
+        return counts
+    finally:
+        cache.delete(LOCK_KEY)
@@ -0,0 +1,100 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import cached_property
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import CustomRefreshToken
+
+UserModel = get_user_model()
+
+
+class TokenClaimsUser(TokenUser):
+    """
+    Lightweight request.user built from the signed token claims.
+    `instance` loads the `CustomUser` row for the few places that need it.
+    """
+
+    @cached_property
+    def id(self):
+        return uuid.UUID(str(self.token[api_settings.USER_ID_CLAIM]))
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def email(self):
+        return self.token['email']
+
+    @cached_property
+    def user_type(self):
+        return self.token['user_type']
+
+    @cached_property
+    def is_visible(self):
+        return self.token['is_visible']
+
+    @cached_property
+    def instance(self):
+        return UserModel.objects.get(pk=self.id)
+
+    def __str__(self):
+        return str(self.email)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds request.user from the token claims instead
+    of loading `CustomUser` on every request. Deactivated users and revoked
+    tokens (including those of a user whose `user_type` changed) are
+    rejected through a cached denylist (see `revoke_user_tokens`).
+    Tokens issued without the user claims, and every token when the cache is
+    not shared between processes (a revocation would only reach one of
+    them), fall back to the database lookup.
+    """
+
+    def get_user(self, validated_token):
+        if not settings.API_CACHE_SHARED:
+            return self.get_database_user(validated_token)
+        if any(claim not in validated_token for claim in CustomRefreshToken.user_claims):
+            return self.get_database_user(validated_token)
+
+        user = TokenClaimsUser(validated_token)
+        if not user.is_visible:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if is_token_revoked(user.id, validated_token):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return user
+
+    def get_database_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not user.is_visible:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
+
+
+def _denylist_key(user_id):
+    return f'token-denylist:{user_id}'
+
+
+def revoke_user_tokens(user_id):
+    """
+    Reject every token issued to `user_id` up to now. The entry only has to
+    outlive the longest token lifetime.
+    """
+    revoked_at = int(time.time())
+    timeout = settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds()
+    cache.set(_denylist_key(user_id), revoked_at, timeout=timeout)
+
+
+def is_token_revoked(user_id, token):
+    revoked_at = cache.get(_denylist_key(user_id))
+    return revoked_at is not None and token.get('iat', 0) <= revoked_at
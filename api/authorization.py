@@ -0,0 +1,94 @@
+"""
+Project role resolution for permission checks.
+
+A user's role on a project is OWNER if they created it, otherwise the role of
+their visible `ProjectRole` (highest one wins). Roles are looked up in batches
+with a single query, memoised on the request and, when the cache is shared
+between processes, cached across requests; the cached entries are
+invalidated from signals when roles or projects change.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, When, IntegerField, OuterRef, Subquery
+
+from .models import Project, ProjectRole
+
+OWNER, EDITOR, READER = 'OWNER', 'EDITOR', 'READER'
+ROLE_PRECEDENCE = {OWNER: 3, EDITOR: 2, READER: 1}
+
+# cache values can not be None, '' stands for "no role"
+NO_ROLE = ''
+
+
+def _cache_key(user_id, project_id):
+    return f'project-role:{user_id}:{project_id}'
+
+
+def _request_cache(request):
+    roles = getattr(request, '_project_roles', None)
+    if roles is None:
+        roles = {}
+        request._project_roles = roles
+    return roles
+
+
+def get_project_roles(request, project_ids):
+    """
+    Return `{project_id: role or None}` for the requesting user, issuing at
+    most one query for ids found in neither the request nor the shared cache.
+    """
+    user_id = request.user.id
+    request_roles = _request_cache(request)
+
+    missing = {project_id for project_id in project_ids if project_id not in request_roles}
+    # invalidations only reach the cache of the process that made them
+    shared = settings.API_CACHE_SHARED
+    if missing and shared:
+        keys = {_cache_key(user_id, project_id): project_id for project_id in missing}
+        for key, role in cache.get_many(keys).items():
+            request_roles[keys[key]] = role or None
+            missing.discard(keys[key])
+
+    if missing:
+        fetched = _fetch_project_roles(user_id, missing)
+        request_roles.update(fetched)
+        if shared:
+            cache.set_many(
+                {_cache_key(user_id, project_id): role or NO_ROLE for project_id, role in fetched.items()},
+                timeout=settings.PROJECT_ROLE_CACHE_TIMEOUT
+            )
+
+    return {project_id: request_roles.get(project_id) for project_id in project_ids}
+
+
+def get_project_role(request, project_id):
+    return get_project_roles(request, [project_id])[project_id]
+
+
+def _fetch_project_roles(user_id, project_ids):
+    precedence = Case(
+        *[When(role=role, then=rank) for role, rank in ROLE_PRECEDENCE.items()],
+        default=0, output_field=IntegerField()
+    )
+    member_role = (ProjectRole.visible_objects
+                   .filter(project=OuterRef('pk'), user_id=user_id)
+                   .order_by(precedence.desc())
+                   .values('role')[:1])
+    rows = (Project.visible_objects.filter(pk__in=project_ids)
+            .annotate(member_role=Subquery(member_role))
+            .values_list('pk', 'created_by_id', 'member_role'))
+
+    roles = dict.fromkeys(project_ids)
+    for project_id, created_by_id, role in rows:
+        roles[project_id] = OWNER if created_by_id == user_id else role
+    return roles
+
+
+def invalidate_project_roles(pairs):
+    """
+    Drop cached roles for an iterable of `(user_id, project_id)` pairs.
+    """
+    keys = [_cache_key(user_id, project_id) for user_id, project_id in pairs
+            if user_id is not None and project_id is not None]
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,311 @@
+"""
+Load benchmark of the API endpoints, run by the `benchmark_api` command.
+
+`seed` fills the database with synthetic users, projects, roles and comments
+at a given scale. `run_benchmark` then drives the scenarios of `get_scenarios`
+through a transport (Django's test `Client`, or the WSGI application called
+directly) and reports the latency percentiles, queries per request and peak
+RSS growth of each. `compare` checks the results against a stored baseline.
+`benchmark_login` measures the login throughput of each password hasher
+profile.
+"""
+import json
+import math
+import random
+import resource
+import sys
+import time
+from collections import namedtuple
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.wsgi import get_wsgi_application
+from django.db import connections, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.module_loading import import_string
+
+from .caching import bump_generation
+from .models import Project, ProjectRole, Comment
+from .search import get_search_indexes
+from .summaries import recompute_summaries
+
+UserModel = get_user_model()
+
+BENCHMARK_PASSWORD = 'benchmark-pass-123'
+
+WORDS = (
+    'alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november '
+    'oscar papa quebec romeo sierra tango uniform victor whiskey xray yankee zulu'
+).split()
+
+Scale = namedtuple('Scale', ['users', 'projects', 'roles_per_project', 'comments'])
+
+
+def sentence(rng, length):
+    return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+
+def seed(scale, using='default', batch_size=5000, random_seed=0):
+    """
+    Create `scale` rows with `bulk_create`, then build the search documents
+    and project summaries in one pass.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(BENCHMARK_PASSWORD)
+
+    with transaction.atomic(using=using):
+        users = [
+            UserModel(email=f'user{i}@benchmark.test', first_name=rng.choice(WORDS).title(),
+                      last_name=rng.choice(WORDS).title(), password=password)
+            for i in range(scale.users)
+        ]
+        UserModel.objects.using(using).bulk_create(users, batch_size=batch_size)
+
+        projects = [
+            Project(name=f'{sentence(rng, 2)} {i}', description=sentence(rng, 12), created_by=users[i % len(users)])
+            for i in range(scale.projects)
+        ]
+        Project.objects.using(using).bulk_create(projects, batch_size=batch_size)
+
+        roles = []
+        for project in projects:
+            roles.append(ProjectRole(user=project.created_by, project=project, role='OWNER'))
+            members = rng.sample(users, min(scale.roles_per_project, len(users)))
+            roles.extend(ProjectRole(user=user, project=project, role=rng.choice(['EDITOR', 'READER']))
+                         for user in members if user is not project.created_by)
+        ProjectRole.objects.using(using).bulk_create(roles, batch_size=batch_size)
+
+        for start in range(0, scale.comments, batch_size):
+            Comment.objects.using(using).bulk_create([
+                Comment(project=rng.choice(projects), user=rng.choice(users), text=sentence(rng, 20))
+                for _ in range(start, min(start + batch_size, scale.comments))
+            ])
+
+        for index in get_search_indexes():
+            index.rebuild(using=using)
+        project_ids = [project.pk for project in projects]
+        for start in range(0, len(project_ids), 500):
+            recompute_summaries(project_ids[start:start + 500], using=using)
+
+    for model in (UserModel, Project, ProjectRole, Comment):
+        bump_generation(model, using=using)
+
+
+def get_credentials(user):
+    return {'email': user.email, 'password': BENCHMARK_PASSWORD}
+
+
+Scenario = namedtuple('Scenario', ['name', 'method', 'path', 'data', 'authenticated'])
+
+
+def get_benchmark_user(using='default'):
+    return UserModel.objects.using(using).order_by('email').first()
+
+
+def get_scenarios(using='default'):
+    """
+    The requests to time, built around the first seeded user and one of
+    their projects.
+    """
+    user = get_benchmark_user(using)
+    project = Project.visible_objects.using(using).filter(created_by=user).order_by('pk').first()
+    comment = Comment.visible_objects.using(using).filter(project=project).order_by('pk').first()
+    word = project.description.split()[0]
+    scenarios = [
+        Scenario('token', 'POST', '/api/v1/token/', get_credentials(user), False),
+        Scenario('projects.list', 'GET', '/api/v1/projects/', None, True),
+        Scenario('projects.search', 'GET', f'/api/v1/projects/?search={word}', None, True),
+        Scenario('projects.ordering', 'GET', '/api/v1/projects/?ordering=name', None, True),
+        Scenario('projects.filter', 'GET', f'/api/v1/projects/?created_by__email={user.email}', None, True),
+        Scenario('projects.detail', 'GET', f'/api/v1/projects/{project.pk}/', None, True),
+        Scenario('projects.summary', 'GET', f'/api/v1/projects/{project.pk}/summary/', None, True),
+        Scenario('projects.create', 'POST', '/api/v1/projects/', {'name': 'benchmark'}, True),
+        Scenario('project_roles.list', 'GET', '/api/v1/project-roles/', None, True),
+        Scenario('project_roles.filter', 'GET', '/api/v1/project-roles/?role=EDITOR', None, True),
+        Scenario('comments.list', 'GET', '/api/v1/comments/', None, True),
+        Scenario('comments.search', 'GET', f'/api/v1/comments/?search={word}', None, True),
+        Scenario('comments.ordering', 'GET', '/api/v1/comments/?ordering=-updated_at', None, True),
+        Scenario('comments.filter', 'GET', f'/api/v1/comments/?project__name={project.name}', None, True),
+        Scenario('comments.create', 'POST', '/api/v1/comments/',
+                 {'project': str(project.pk), 'text': 'benchmark'}, True),
+    ]
+    if comment is not None:
+        scenarios.append(Scenario('comments.detail', 'GET', f'/api/v1/comments/{comment.pk}/', None, True))
+    return scenarios
+
+
+class ClientTransport:
+    """
+    Requests through Django's test client.
+    """
+    name = 'client'
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.client.generic(method, path, json.dumps(data) if data is not None else '',
+                                       content_type='application/json', headers=headers)
+        return response.status_code, response.content
+
+
+class WSGITransport:
+    """
+    Requests built by `RequestFactory` handed to the WSGI application, as a
+    WSGI server would.
+    """
+    name = 'wsgi'
+
+    def __init__(self):
+        self.application = get_wsgi_application()
+        self.factory = RequestFactory()
+
+    def request(self, method, path, data=None, headers=None):
+        request = self.factory.generic(method, path, json.dumps(data) if data is not None else '',
+                                       content_type='application/json', headers=headers)
+        environ = dict(request.environ, **{'wsgi.input': BytesIO(request.body)})
+        status = []
+        chunks = self.application(environ, lambda code, response_headers, exc_info=None: status.append(code))
+        try:
+            content = b''.join(chunks)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        return int(status[0].split()[0]), content
+
+
+TRANSPORTS = {
+    'client': ClientTransport,
+    'wsgi': WSGITransport,
+}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of the sorted `values`.
+    """
+    index = max(0, min(len(values) - 1, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def run_benchmark(transport, scenarios, credentials, iterations=50, warmup=5, warm_cache=False,
+                  using='default'):
+    """
+    Time every scenario and return `{name: result}`. The cache is cleared
+    before each request unless `warm_cache` is set, so list requests are not
+    answered from the response cache. `peak_rss_growth_mb` is how much the
+    scenario raised the peak RSS of the process; the peak itself only grows,
+    so it is a property of the whole run (see `peak_rss_mb`).
+    """
+    status, content = transport.request('POST', '/api/v1/token/', credentials)
+    if status != 200:
+        raise RuntimeError(f'could not obtain a token: {status} {content[:200]!r}')
+    headers = {'Authorization': f'Bearer {json.loads(content)["access"]}'}
+
+    results = {}
+    for scenario in scenarios:
+        request_headers = headers if scenario.authenticated else None
+        durations, queries = [], []
+        peak_before = peak_rss_mb()
+        for i in range(warmup + iterations):
+            if not warm_cache:
+                cache.clear()
+            with CaptureQueriesContext(connections[using]) as ctx:
+                started = time.perf_counter()
+                status, content = transport.request(scenario.method, scenario.path, scenario.data, request_headers)
+                duration = time.perf_counter() - started
+            if status >= 400:
+                raise RuntimeError(f'{scenario.name}: {scenario.method} {scenario.path} returned {status}')
+            if i >= warmup:
+                durations.append(duration * 1000)
+                queries.append(len(ctx.captured_queries))
+
+        durations.sort()
+        results[scenario.name] = {
+            'p50_ms': round(percentile(durations, 50), 3),
+            'p95_ms': round(percentile(durations, 95), 3),
+            'p99_ms': round(percentile(durations, 99), 3),
+            'queries': max(queries),
+            'peak_rss_growth_mb': round(peak_rss_mb() - peak_before, 1),
+        }
+    return results
+
+
+def get_hasher_profiles():
+    """
+    The profiles of `settings.PASSWORD_HASHER_PROFILES` whose hasher library
+    is installed.
+    """
+    profiles = []
+    for profile, path in settings.PASSWORD_HASHER_PROFILES.items():
+        hasher = import_string(path)()
+        try:
+            if hasher.library:
+                hasher._load_library()
+        except ValueError:
+            continue
+        profiles.append(profile)
+    return profiles
+
+
+def benchmark_login(transport, user, profiles, iterations=20, using='default'):
+    """
+    Time `iterations` logins of `user` with each hasher profile preferred and
+    its password hashed by it. Returns `{profile: result}`.
+    """
+    results = {}
+    password = user.password
+    try:
+        for profile in profiles:
+            path = settings.PASSWORD_HASHER_PROFILES[profile]
+            hashers = [path] + [hasher for hasher in settings.PASSWORD_HASHERS if hasher != path]
+            with override_settings(PASSWORD_HASHERS=hashers):
+                user.set_password(BENCHMARK_PASSWORD)
+                user.save(using=using, update_fields=['password'])
+
+                durations = []
+                for _ in range(iterations):
+                    started = time.perf_counter()
+                    status, content = transport.request('POST', '/api/v1/token/', get_credentials(user))
+                    durations.append((time.perf_counter() - started) * 1000)
+                    if status != 200:
+                        raise RuntimeError(f'{profile}: login returned {status} {content[:200]!r}')
+
+            durations.sort()
+            results[profile] = {
+                'p50_ms': round(percentile(durations, 50), 3),
+                'p95_ms': round(percentile(durations, 95), 3),
+                'logins_per_s': round(1000 * len(durations) / sum(durations), 2),
+            }
+    finally:
+        UserModel.objects.using(using).filter(pk=user.pk).update(password=password)
+    return results
+
+
+def compare(results, baseline, threshold=0.2, min_delta_ms=1.0):
+    """
+    Return the regressions of `results` against `baseline`: a p95 latency
+    more than `threshold` (a fraction) and `min_delta_ms` above the baseline,
+    or more queries per request than the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        limit = max(expected['p95_ms'] * (1 + threshold), expected['p95_ms'] + min_delta_ms)
+        if result['p95_ms'] > limit:
+            regressions.append(f'{name}: p95 {result["p95_ms"]:.1f} ms, baseline {expected["p95_ms"]:.1f} ms')
+        if result['queries'] > expected['queries']:
+            regressions.append(f'{name}: {result["queries"]} queries, baseline {expected["queries"]}')
+    return regressions
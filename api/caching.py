@@ -0,0 +1,65 @@
+"""
+Per-model generation counters and the cached list response store.
+
+Every save, soft delete or delete of a model bumps its generation. Cached
+responses are keyed by the generations of the models they depend on, so a
+write makes older entries unreachable without having to find and delete them.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.checks import Warning, register
+from django.db import connections, transaction
+
+
+def _generation_key(model):
+    return f'generation:{model._meta.label_lower}'
+
+
+def get_generations(models):
+    """
+    Return the current generation of each model in `models`, in order.
+    Generations are nanosecond timestamps of the last change, so a counter
+    evicted from the cache never comes back with an older value.
+    """
+    keys = [_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return tuple(generations[key] for key in keys)
+
+
+def bump_generation(model, using='default'):
+    """
+    Invalidate everything cached on top of `model`. Inside a transaction the
+    generation is bumped again on commit, so a response cached from data read
+    between the write and the commit does not outlive the commit.
+    """
+    key = _generation_key(model)
+    cache.set(key, time.time_ns(), timeout=None)
+    if connections[using].in_atomic_block:
+        transaction.on_commit(lambda: cache.set(key, time.time_ns(), timeout=None), using=using)
+
+
+def get_response_cache_key(prefix, generations, *parts):
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f'api-response:{prefix}:{"-".join(map(str, generations))}:{digest}'
+
+
+@register('api', deploy=True)
+def check_cache_is_shared(app_configs, **kwargs):
+    if settings.API_CACHE_SHARED:
+        return []
+    return [Warning(
+        'The cache is not shared between processes: list responses and project roles are not '
+        'cached, tokens are checked against the database, and replica pins and the archive lock '
+        'only hold within a process.',
+        hint='Set CACHE_BACKEND=redis and CACHE_LOCATION, or CACHE_SHARED=True when a single process '
+             'serves the API.',
+        id='api.W003',
+    )]
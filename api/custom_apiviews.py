@@ -1,10 +1,346 @@
-from rest_framework import generics
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .authorization import get_project_roles
+from .events import get_broker
+from .renderers import EventStreamRenderer
+from .serializers import PrefetchedPrimaryKeyRelatedField
 from .mixins import (
-    DisablePaginationMixin
+    ResponseCacheMixin,
+    DeltaSyncMixin,
+    CompactRepresentationMixin,
+    SparseFieldsMixin,
+    ValuesSerializationMixin,
+    DisablePaginationMixin,
+    CursorPaginationMixin,
+    ConditionalRequestMixin,
+    AsyncViewMixin,
+    AsyncListMixin,
+    AsyncRetrieveMixin,
 )
 
 
-class CustomListCreateAPIView(DisablePaginationMixin,
+class CustomListCreateAPIView(ResponseCacheMixin,
+                              DeltaSyncMixin,
+                              CompactRepresentationMixin,
+                              SparseFieldsMixin,
+                              ValuesSerializationMixin,
+                              DisablePaginationMixin,
+                              CursorPaginationMixin,
+                              AsyncListMixin,
                               generics.ListCreateAPIView):
-    pass
+    """
+    Runs as an async view when `settings.API_ASYNC_VIEWS` is set: GET is
+    served through the async ORM, POST by the sync handler in a thread.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if self.async_views:
+            return self.alist(request, *args, **kwargs)
+        return super().get(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        if self.async_views:
+            return sync_to_async(self.create)(request, *args, **kwargs)
+        return super().post(request, *args, **kwargs)
+
+
+class CustomRetrieveUpdateDestroyAPIView(ConditionalRequestMixin,
+                                         AsyncRetrieveMixin,
+                                         generics.RetrieveUpdateDestroyAPIView):
+    """
+    Runs as an async view when `settings.API_ASYNC_VIEWS` is set: GET is
+    served through the async ORM, writes by the sync handlers in a thread.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if self.async_views:
+            return self.aretrieve(request, *args, **kwargs)
+        return super().get(request, *args, **kwargs)
+
+    def put(self, request, *args, **kwargs):
+        if self.async_views:
+            return sync_to_async(self.update)(request, *args, **kwargs)
+        return super().put(request, *args, **kwargs)
+
+    def patch(self, request, *args, **kwargs):
+        if self.async_views:
+            return sync_to_async(self.partial_update)(request, *args, **kwargs)
+        return super().patch(request, *args, **kwargs)
+
+    def delete(self, request, *args, **kwargs):
+        if self.async_views:
+            return sync_to_async(self.destroy)(request, *args, **kwargs)
+        return super().delete(request, *args, **kwargs)
+
+
+class BulkAPIView(generics.GenericAPIView):
+    """
+    Batch create (POST), partial update (PATCH) and soft delete (DELETE).
+
+    POST and PATCH take a list of objects (PATCH items carry an `id`), DELETE
+    takes a list of ids. The whole batch is validated first and any invalid
+    item rejects the batch with 400. Items that are missing or not permitted
+    are reported and skipped. The rest is written in one transaction with
+    bulk_create / bulk_update / a single soft delete UPDATE. Every response
+    lists one result per item, in request order.
+    """
+    http_method_names = ['post', 'patch', 'delete']
+    # the field filled with the requesting user on create
+    owner_field = None
+    max_batch_size = 500
+
+    def get_items(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError('Expected a non-empty list.')
+        if len(items) > self.max_batch_size:
+            raise ValidationError(f'At most {self.max_batch_size} items can be sent at once.')
+        return items
+
+    def get_related_objects(self, items):
+        """
+        Fetch every object referenced by a related field of the items with
+        one query per field.
+        """
+        related_objects = {}
+        for field_name, field in self.get_serializer().fields.items():
+            if field.read_only or not isinstance(field, PrefetchedPrimaryKeyRelatedField):
+                continue
+            queryset = field.get_queryset()
+            pks = set()
+            for item in items:
+                try:
+                    pks.add(queryset.model._meta.pk.to_python(item.get(field_name)))
+                except (AttributeError, DjangoValidationError, TypeError, ValueError):
+                    continue
+            pks.discard(None)
+            related_objects[field_name] = queryset.in_bulk(pks) if pks else {}
+        return related_objects
+
+    def get_item_serializers(self, items, instances=None):
+        context = self.get_serializer_context()
+        context['related_objects'] = self.get_related_objects(items)
+        serializer_class = self.get_serializer_class()
+        if instances is None:
+            return [serializer_class(data=item, context=context) for item in items]
+        return [serializer_class(instance, data=item, partial=True, context=context)
+                for instance, item in zip(instances, items)]
+
+    def get_ids(self, ids):
+        if not all(isinstance(pk, str) for pk in ids):
+            raise ValidationError('Every id must be a string.')
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Ids must be unique.')
+        return ids
+
+    def get_batch_errors(self, serializers, indexes=None):
+        """
+        Validate every serializer and return the 400 response listing the
+        invalid items, or `None` when the whole batch is valid.
+        """
+        errors = [{} if serializer.is_valid() else serializer.errors for serializer in serializers]
+        if not any(errors):
+            return None
+        indexes = range(len(serializers)) if indexes is None else indexes
+        return Response({'results': [
+            {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': item_errors}
+            for index, item_errors in zip(indexes, errors) if item_errors
+        ]}, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_permitted_objects(self, pks):
+        """
+        Return `{pk: result}` where result is the object, or the status code
+        explaining why it can not be written.
+        """
+        model = self.get_queryset().model
+        parsed = {}
+        for pk in pks:
+            try:
+                parsed[pk] = model._meta.pk.to_python(pk)
+            except (DjangoValidationError, TypeError, ValueError):
+                parsed[pk] = None
+
+        objects = self.get_queryset().in_bulk([pk for pk in parsed.values() if pk is not None])
+        project_ids = [getattr(obj, 'project_id', obj.pk) for obj in objects.values()]
+        # one batched role lookup for the whole request
+        get_project_roles(self.request, [pk for pk in project_ids if pk is not None])
+
+        results = {}
+        for pk, parsed_pk in parsed.items():
+            obj = objects.get(parsed_pk)
+            if obj is None:
+                results[pk] = status.HTTP_404_NOT_FOUND
+            elif not all(permission.has_object_permission(self.request, self, obj)
+                         for permission in self.get_permissions()):
+                results[pk] = status.HTTP_403_FORBIDDEN
+            else:
+                results[pk] = obj
+        return results
+
+    def post(self, request, *args, **kwargs):
+        items = self.get_items(request)
+        serializers = self.get_item_serializers(items)
+        errors = self.get_batch_errors(serializers)
+        if errors is not None:
+            return errors
+
+        model = self.get_queryset().model
+        owner = {f'{self.owner_field}_id': request.user.id} if self.owner_field else {}
+        objects = [model(**serializer.validated_data, **owner) for serializer in serializers]
+        with transaction.atomic():
+            model.objects.bulk_create(objects)
+            model.notify_rows_changed([obj.pk for obj in objects], instances=objects, created=True)
+
+        return Response({'results': [
+            {'index': index, 'status': status.HTTP_201_CREATED, 'id': obj.pk}
+            for index, obj in enumerate(objects)
+        ]}, status=status.HTTP_201_CREATED)
+
+    def patch(self, request, *args, **kwargs):
+        items = self.get_items(request)
+        if not all(isinstance(item, dict) and 'id' in item for item in items):
+            raise ValidationError('Every item needs an `id`.')
+
+        permitted = self.get_permitted_objects(self.get_ids([item['id'] for item in items]))
+        writable = [(index, item) for index, item in enumerate(items) if not isinstance(permitted[item['id']], int)]
+        serializers = self.get_item_serializers(
+            [item for _, item in writable], [permitted[item['id']] for _, item in writable]
+        )
+        errors = self.get_batch_errors(serializers, [index for index, _ in writable])
+        if errors is not None:
+            return errors
+
+        now = timezone.now()
+        fields, objects = {'updated_at'}, []
+        for serializer in serializers:
+            for attr, value in serializer.validated_data.items():
+                setattr(serializer.instance, attr, value)
+                fields.add(attr)
+            serializer.instance.updated_at = now
+            objects.append(serializer.instance)
+
+        model = self.get_queryset().model
+        if objects:
+            with transaction.atomic():
+                model.objects.bulk_update(objects, sorted(fields))
+                model.notify_rows_changed([obj.pk for obj in objects], instances=objects)
+
+        return Response({'results': [
+            self.get_item_result(index, item['id'], permitted[item['id']], status.HTTP_200_OK)
+            for index, item in enumerate(items)
+        ]})
+
+    def delete(self, request, *args, **kwargs):
+        pks = self.get_ids(self.get_items(request))
+        permitted = self.get_permitted_objects(pks)
+        writable = [obj.pk for obj in permitted.values() if not isinstance(obj, int)]
+        if writable:
+            self.get_queryset().model.bulk_soft_delete(writable)
+
+        return Response({'results': [
+            self.get_item_result(index, pk, permitted[pk], status.HTTP_204_NO_CONTENT)
+            for index, pk in enumerate(pks)
+        ]})
+
+    def get_item_result(self, index, pk, result, success_status):
+        return {'index': index, 'id': pk, 'status': result if isinstance(result, int) else success_status}
+
+
+
+class EventStreamAPIView(AsyncViewMixin, generics.GenericAPIView):
+    """
+    Streams the broker stream returned by `get_stream_id()` as Server-Sent
+    Events, starting after the `Last-Event-ID` header (or `lastEventId`
+    query parameter) and otherwise at the current end of the stream.
+
+    A stream ends after `stream_timeout` seconds and the client reconnects
+    with the last id it has seen. When that id can not be replayed a `reset`
+    event tells the client to reload. Streams hold their connection open, so
+    they are served by the async views (ASGI) only; under WSGI, where each
+    would hold a worker, they are refused with 503 unless
+    `settings.API_WSGI_EVENT_STREAMS` is set.
+    """
+    http_method_names = ['get']
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+    keepalive_interval = 15
+    stream_timeout = 300
+    # reconnection delay suggested to the client, in milliseconds
+    retry = 3000
+
+    def get_stream_id(self):
+        raise NotImplementedError
+
+    def get_last_event_id(self, request):
+        return request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('lastEventId')
+
+    def get(self, request, *args, **kwargs):
+        if self.async_views:
+            return self.aget(request)
+        if not settings.API_WSGI_EVENT_STREAMS:
+            return Response({'detail': 'Event streams are only served by the async views (ASGI).'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return self.get_stream_response(request, self.get_stream_id())
+
+    async def aget(self, request):
+        stream_id = await sync_to_async(self.get_stream_id)()
+        return self.get_stream_response(request, stream_id)
+
+    def get_stream_response(self, request, stream_id):
+        broker = get_broker()
+        last_event_id = self.get_last_event_id(request) or broker.latest_id(stream_id)
+        if self.async_views:
+            content = self.aiter_stream(broker, stream_id, last_event_id)
+        else:
+            content = self.iter_stream(broker, stream_id, last_event_id)
+        response = StreamingHttpResponse(content, content_type=EventStreamRenderer.media_type)
+        response['Cache-Control'] = 'no-cache'
+        # stop proxies (nginx) from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def iter_stream(self, broker, stream_id, last_event_id):
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        yield f'retry: {self.retry}\n\n'
+        deadline = time.monotonic() + self.stream_timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            events, complete = broker.wait(stream_id, last_event_id, min(self.keepalive_interval, remaining))
+            chunk, last_event_id = self.encode_events(broker, stream_id, events, complete, last_event_id, encoder)
+            yield chunk
+
+    async def aiter_stream(self, broker, stream_id, last_event_id):
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        yield f'retry: {self.retry}\n\n'
+        deadline = time.monotonic() + self.stream_timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            events, complete = await broker.await_events(
+                stream_id, last_event_id, min(self.keepalive_interval, remaining)
+            )
+            chunk, last_event_id = self.encode_events(broker, stream_id, events, complete, last_event_id, encoder)
+            yield chunk
 
+    def encode_events(self, broker, stream_id, events, complete, last_event_id, encoder):
+        """
+        Return the text to send and the id to continue from.
+        """
+        if not complete:
+            last_event_id = broker.latest_id(stream_id)
+            return f'id: {last_event_id}\nevent: reset\ndata: {{}}\n\n', last_event_id
+        if not events:
+            # comment lines keep idle connections from being closed
+            return ': keepalive\n\n', last_event_id
+        return ''.join(
+            f'id: {event.id}\nevent: {event.type}\ndata: {encoder.encode(event.data)}\n\n' for event in events
+        ), events[-1].id
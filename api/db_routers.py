@@ -0,0 +1,202 @@
+"""
+Routing of the read-only API traffic to the read replicas.
+
+`ReplicaMiddleware` marks GET/HEAD/OPTIONS requests as read-only when
+`settings.API_READ_REPLICAS` lists replica aliases, and `ReplicaRouter` sends
+the reads of marked requests to a replica. Everything else, writes included,
+uses the primary (`default`). Streamed responses keep reading from the
+replica chosen for their request while the body is produced.
+
+Replicas are picked per request by `settings.API_READ_REPLICA_SELECTION`:
+`round_robin` (smooth weighted round robin in each process) or `random`,
+both honouring `settings.API_READ_REPLICA_WEIGHTS`.
+
+After a successful write, the client (its Authorization header, or session
+cookie) is pinned to the primary for `settings.API_REPLICA_PIN_SECONDS`, so
+a list read right after `POST /comments/` sees the new comment despite the
+replication lag. Pins are kept in the cache; share it between the workers.
+"""
+import contextvars
+import hashlib
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from rest_framework.permissions import SAFE_METHODS
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def get_read_alias():
+    """
+    Return the replica the current request reads from, or `None`.
+    """
+    return _read_alias.get()
+
+
+class RoundRobinSelector:
+    """
+    Smooth weighted round robin: over `sum(weights)` picks every replica is
+    chosen `weight` times, interleaved.
+    """
+
+    def __init__(self, weights):
+        self.weights = weights
+        self.current = {alias: 0 for alias, weight in weights}
+        self.lock = threading.Lock()
+
+    def choose(self):
+        total = sum(weight for alias, weight in self.weights)
+        with self.lock:
+            for alias, weight in self.weights:
+                self.current[alias] += weight
+            chosen = max(self.current, key=self.current.get)
+            self.current[chosen] -= total
+        return chosen
+
+
+class RandomSelector:
+
+    def __init__(self, weights):
+        self.aliases = [alias for alias, weight in weights]
+        self.weights = [weight for alias, weight in weights]
+
+    def choose(self):
+        return random.choices(self.aliases, self.weights)[0]
+
+
+SELECTORS = {
+    'round_robin': RoundRobinSelector,
+    'random': RandomSelector,
+}
+
+_selector = (None, None)
+
+
+def choose_replica():
+    global _selector
+    weights = tuple((alias, settings.API_READ_REPLICA_WEIGHTS.get(alias, 1)) for alias in settings.API_READ_REPLICAS)
+    key = (settings.API_READ_REPLICA_SELECTION, weights)
+    # rebuilt when the settings change
+    if _selector[0] != key:
+        _selector = (key, SELECTORS[settings.API_READ_REPLICA_SELECTION](weights))
+    return _selector[1].choose()
+
+
+def get_pin_key(request):
+    """
+    Return the cache key pinning the client of `request` to the primary, or
+    `None` for anonymous clients.
+    """
+    credential = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return f'replica-pin:{hashlib.sha256(credential.encode()).hexdigest()}'
+
+
+def pin_to_primary(request):
+    key = get_pin_key(request)
+    if key is not None:
+        cache.set(key, True, timeout=settings.API_REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(request):
+    key = get_pin_key(request)
+    return key is not None and cache.get(key, False)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.API_READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.API_READ_REPLICAS:
+            return False
+        return None
+
+
+# the stream may be closed from another context than the one it ran in, so
+# these set the alias back to None rather than resetting a token
+
+def read_from(alias, iterator):
+    _read_alias.set(alias)
+    try:
+        yield from iterator
+    finally:
+        _read_alias.set(None)
+
+
+async def aread_from(alias, iterator):
+    _read_alias.set(alias)
+    try:
+        async for chunk in iterator:
+            yield chunk
+    finally:
+        _read_alias.set(None)
+
+
+@sync_and_async_middleware
+class ReplicaMiddleware:
+    """
+    Read from a replica during safe-method requests; see the module docstring.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        alias = self.get_alias(request)
+        token = _read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        return self.process_response(request, response, alias)
+
+    async def __acall__(self, request):
+        alias = self.get_alias(request)
+        token = _read_alias.set(alias)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        return self.process_response(request, response, alias)
+
+    def get_alias(self, request):
+        if request.method not in SAFE_METHODS or not settings.API_READ_REPLICAS:
+            return None
+        if is_pinned_to_primary(request):
+            return None
+        return choose_replica()
+
+    def process_response(self, request, response, alias):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and settings.API_READ_REPLICAS:
+            pin_to_primary(request)
+        if alias is not None and response.streaming:
+            # the body is read after the middleware returns
+            if response.is_async:
+                response.streaming_content = aread_from(alias, response.streaming_content)
+            else:
+                response.streaming_content = read_from(alias, response.streaming_content)
+        return response
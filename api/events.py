@@ -0,0 +1,263 @@
+"""
+Per-project change events for the Server-Sent Events feed.
+
+Comment and ProjectRole writes are published (after commit) to the project's
+stream through the configured broker, `settings.API_EVENT_BROKER`:
+
+- `InProcessBroker` keeps a ring buffer per project in memory and wakes
+  waiting streams immediately. Events only reach streams served by the same
+  process.
+- `CacheBroker` keeps the buffer in the Django cache, so every worker sharing
+  the cache (redis, file) sees every event. Streams poll the cache.
+
+Event ids are `<epoch>-<sequence>`, the sequence counting per project. A
+stream resuming from an id the broker can no longer replay (another epoch,
+or older than the buffer) gets `complete=False` back and should tell the
+client to reload.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .fast_serializers import get_values_plan
+from .models import ProjectRole, Comment
+from .serializers import ProjectRoleListSerializer, CommentListSerializer
+
+Event = namedtuple('Event', ['id', 'type', 'data'])
+
+
+def parse_event_id(event_id):
+    """
+    Return `(epoch, sequence)`, or `(None, None)` for malformed ids.
+    """
+    epoch, _, sequence = (event_id or '').rpartition('-')
+    try:
+        return epoch, int(sequence)
+    except ValueError:
+        return None, None
+
+
+class BaseBroker:
+    """
+    Subclasses implement `epoch`, `publish`, `latest_id` and `read`. Waiting
+    falls back to polling `read` every `poll_interval` seconds.
+    """
+    buffer_size = 500
+    poll_interval = 1
+
+    def publish(self, project_id, event_type, data):
+        raise NotImplementedError
+
+    def latest_id(self, project_id):
+        raise NotImplementedError
+
+    def read(self, project_id, last_event_id):
+        """
+        Return `(events, complete)`: the buffered events after
+        `last_event_id`, and whether they are all the events since then.
+        """
+        raise NotImplementedError
+
+    def wait(self, project_id, last_event_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            events, complete = self.read(project_id, last_event_id)
+            remaining = deadline - time.monotonic()
+            if events or not complete or remaining <= 0:
+                return events, complete
+            time.sleep(min(self.poll_interval, remaining))
+
+    async def await_events(self, project_id, last_event_id, timeout):
+        deadline = time.monotonic() + timeout
+        # reads may block on the backing store, keep them off the event loop
+        read = sync_to_async(self.read, thread_sensitive=False)
+        while True:
+            events, complete = await read(project_id, last_event_id)
+            remaining = deadline - time.monotonic()
+            if events or not complete or remaining <= 0:
+                return events, complete
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+
+class InProcessBroker(BaseBroker):
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._condition = threading.Condition(threading.RLock())
+        self._sequences = {}
+        self._buffers = {}
+        self._async_waiters = {}
+
+    def publish(self, project_id, event_type, data):
+        project_id = str(project_id)
+        with self._condition:
+            sequence = self._sequences.get(project_id, 0) + 1
+            self._sequences[project_id] = sequence
+            event = Event(f'{self.epoch}-{sequence}', event_type, data)
+            buffer = self._buffers.setdefault(project_id, deque(maxlen=self.buffer_size))
+            buffer.append((sequence, event))
+            self._condition.notify_all()
+            waiters = list(self._async_waiters.get(project_id, ()))
+
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:
+                # the waiting loop has been closed
+                pass
+        return event
+
+    def latest_id(self, project_id):
+        with self._condition:
+            return f'{self.epoch}-{self._sequences.get(str(project_id), 0)}'
+
+    def read(self, project_id, last_event_id):
+        project_id = str(project_id)
+        epoch, last_sequence = parse_event_id(last_event_id)
+        with self._condition:
+            latest = self._sequences.get(project_id, 0)
+            if epoch != self.epoch or last_sequence > latest:
+                return [], False
+            buffer = self._buffers.get(project_id, ())
+            oldest = buffer[0][0] if buffer else latest + 1
+            events = [event for sequence, event in buffer if sequence > last_sequence]
+        return events, last_sequence >= oldest - 1
+
+    def wait(self, project_id, last_event_id, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self._ready(project_id, last_event_id), timeout)
+        return self.read(project_id, last_event_id)
+
+    async def await_events(self, project_id, last_event_id, timeout):
+        project_id = str(project_id)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        # registered before the first read so no publish can slip in between
+        with self._condition:
+            self._async_waiters.setdefault(project_id, set()).add(waiter)
+        try:
+            if not self._ready(project_id, last_event_id):
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self.read(project_id, last_event_id)
+        finally:
+            with self._condition:
+                self._async_waiters[project_id].discard(waiter)
+
+    def _ready(self, project_id, last_event_id):
+        events, complete = self.read(project_id, last_event_id)
+        return bool(events) or not complete
+
+
+class CacheBroker(BaseBroker):
+    """
+    Events are stored as individual cache keys next to an atomically
+    incremented per-project sequence.
+    """
+    event_timeout = 600
+
+    @property
+    def epoch(self):
+        cache.add('events:epoch', uuid.uuid4().hex[:8], timeout=None)
+        return cache.get('events:epoch')
+
+    def publish(self, project_id, event_type, data):
+        sequence_key = f'events:{project_id}:sequence'
+        cache.add(sequence_key, 0, timeout=None)
+        sequence = cache.incr(sequence_key)
+        event = Event(f'{self.epoch}-{sequence}', event_type, data)
+        cache.set(f'events:{project_id}:{sequence}', event, timeout=self.event_timeout)
+        return event
+
+    def latest_id(self, project_id):
+        return f'{self.epoch}-{cache.get(f"events:{project_id}:sequence", 0)}'
+
+    def read(self, project_id, last_event_id):
+        epoch, last_sequence = parse_event_id(last_event_id)
+        latest = cache.get(f'events:{project_id}:sequence', 0)
+        if epoch != self.epoch or last_sequence > latest:
+            return [], False
+        first = max(last_sequence + 1, latest - self.buffer_size + 1)
+        keys = [f'events:{project_id}:{sequence}' for sequence in range(first, latest + 1)]
+        found = cache.get_many(keys) if keys else {}
+        events = [found[key] for key in keys if key in found]
+        return events, first == last_sequence + 1 and len(events) == len(keys)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.API_EVENT_BROKER)()
+    return _broker
+
+
+# models with a stream: event type prefix and the serializer of the payload
+STREAMS = {
+    Comment: ('comment', CommentListSerializer),
+    ProjectRole: ('project_role', ProjectRoleListSerializer),
+}
+
+
+def publish_changes(model, pks, created=False, using='default'):
+    """
+    Publish `<prefix>.created|updated|deleted` events for the rows in `pks`
+    once the current transaction commits. Rows no longer visible are
+    reported as deleted.
+    """
+    pks = list(pks)
+    transaction.on_commit(lambda: _publish_changes(model, pks, created, using), using=using)
+
+
+def publish_deletion(model, pk, project_id, using='default'):
+    publish_deletions(model, [(pk, project_id)], using=using)
+
+
+def publish_deletions(model, rows, using='default'):
+    """
+    Publish `<prefix>.deleted` events for the `(pk, project_id)` pairs in
+    `rows` once the current transaction commits.
+    """
+    prefix, _ = STREAMS[model]
+    rows = list(rows)
+
+    def publish():
+        broker = get_broker()
+        for pk, project_id in rows:
+            broker.publish(project_id, f'{prefix}.deleted', {'id': str(pk)})
+
+    transaction.on_commit(publish, using=using)
+
+
+def _publish_changes(model, pks, created, using):
+    prefix, serializer_class = STREAMS[model]
+    # the list endpoint's representation, read with one query
+    plan = get_values_plan(serializer_class())
+    queryset = model._default_manager.using(using).filter(pk__in=pks)
+    broker = get_broker()
+
+    if plan is None:
+        rows = [(obj.pk, obj.project_id, obj.is_visible, serializer_class(obj).data) for obj in queryset]
+    else:
+        to_representation = plan.bind()
+        rows = [(row['pk'], row['project_id'], row['is_visible'], to_representation(row))
+                for row in queryset.values(*plan.columns, 'pk', 'project_id', 'is_visible')]
+
+    for pk, project_id, is_visible, data in rows:
+        if project_id is None:
+            continue
+        if is_visible:
+            broker.publish(project_id, f'{prefix}.{"created" if created else "updated"}', data)
+        else:
+            broker.publish(project_id, f'{prefix}.deleted', {'id': str(pk)})
@@ -0,0 +1,179 @@
+"""
+Read-only serialization straight from `.values()` rows.
+
+A `ValuesPlan` is compiled once from a bound `ModelSerializer` and reproduces
+its `to_representation` output for rows fetched with `.values(*plan.columns)`,
+without building model instances or walking DRF's per-field `get_attribute`
+machinery. Serializers using anything the plan cannot reproduce exactly
+(method fields, dotted sources, many=True nesting, ...) compile to `None` and
+callers fall back to the regular serializer.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+
+from rest_framework import serializers, relations, ISO_8601
+from rest_framework.settings import api_settings
+
+
+class ValuesPlan:
+    """
+    A precompiled list of steps `(field_name, column, convert, nested_plan)`.
+
+    Converters that depend on the active time zone are resolved by `bind()`
+    once per batch of rows rather than once per value.
+    """
+
+    def __init__(self, steps, columns):
+        self.steps = tuple(steps)
+        self.columns = tuple(columns)
+
+    def bind(self):
+        """
+        Return a `row -> dict` function with all converters resolved.
+        """
+        steps = []
+        for field_name, column, convert, nested_plan in self.steps:
+            if isinstance(convert, DateTimeConverter):
+                convert = convert.bind()
+            steps.append((field_name, column, convert, nested_plan and nested_plan.bind()))
+
+        def to_representation(row):
+            ret = {}
+            for field_name, column, convert, nested in steps:
+                value = row[column]
+                if value is None:
+                    ret[field_name] = None
+                elif nested is not None:
+                    ret[field_name] = nested(row)
+                elif convert is None:
+                    ret[field_name] = value
+                else:
+                    ret[field_name] = convert(value)
+            return ret
+
+        return to_representation
+
+    def to_representation(self, row):
+        return self.bind()(row)
+
+    def serialize_rows(self, rows):
+        to_representation = self.bind()
+        return [to_representation(row) for row in rows]
+
+    def iter_rows(self, rows):
+        to_representation = self.bind()
+        for row in rows:
+            yield to_representation(row)
+
+
+class DateTimeConverter:
+    """
+    `DateTimeField.to_representation` with the field time zone looked up once
+    in `bind()` instead of on every value.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def bind(self):
+        field = self.field
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+            return field.to_representation
+
+        def convert(value):
+            if isinstance(value, str) or timezone.is_naive(value):
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+
+        return convert
+
+
+class UnsupportedField(Exception):
+    pass
+
+
+_plan_cache = {}
+
+
+def get_values_plan(serializer, cache_key=None):
+    """
+    Return the cached `ValuesPlan` for `serializer`, or `None` if it can not be
+    served from `.values()` rows. Plans are cached per serializer class unless
+    a more specific `cache_key` is given.
+    """
+    if cache_key is None:
+        cache_key = type(serializer)
+    try:
+        return _plan_cache[cache_key]
+    except KeyError:
+        pass
+
+    try:
+        plan = compile_values_plan(serializer)
+    except UnsupportedField:
+        plan = None
+    _plan_cache[cache_key] = plan
+    return plan
+
+
+def compile_values_plan(serializer, prefix=''):
+    model = serializer.Meta.model
+    steps, columns = [], []
+
+    for field in serializer._readable_fields:
+        if len(field.source_attrs) != 1:
+            raise UnsupportedField(field.field_name)
+        source = field.source_attrs[0]
+        column = prefix + source
+
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise UnsupportedField(field.field_name)
+        if not model_field.concrete:
+            raise UnsupportedField(field.field_name)
+
+        if isinstance(field, serializers.ModelSerializer):
+            if not model_field.many_to_one and not model_field.one_to_one:
+                raise UnsupportedField(field.field_name)
+            nested_plan = compile_values_plan(field, prefix=column + '__')
+            steps.append((field.field_name, column, None, nested_plan))
+            columns.append(column)
+            columns.extend(nested_plan.columns)
+            continue
+
+        steps.append((field.field_name, column, get_converter(field), None))
+        columns.append(column)
+
+    # `dict.fromkeys` drops duplicates while keeping the order
+    return ValuesPlan(steps, dict.fromkeys(columns))
+
+
+def get_converter(field):
+    """
+    Return the callable applied to a non-null column value, or `None` when
+    the raw value is already what the field would produce.
+    """
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        if field.pk_field is not None:
+            return field.pk_field.to_representation
+        return None
+    if isinstance(field, serializers.CharField) and type(field).to_representation is serializers.CharField.to_representation:
+        # CharField.to_representation is str(), a no-op for text columns
+        return None
+    if isinstance(field, serializers.UUIDField):
+        if field.uuid_format == 'hex_verbose':
+            return str
+        return field.to_representation
+    if isinstance(field, serializers.DateTimeField):
+        return DateTimeConverter(field)
+    if isinstance(field, (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+                          serializers.ChoiceField, serializers.DateField,
+                          serializers.DecimalField, serializers.FloatField)):
+        return field.to_representation
+    raise UnsupportedField(field.field_name)
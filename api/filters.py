@@ -0,0 +1,20 @@
+from django_filters import rest_framework as filters
+
+from .models import ProjectSummary
+
+
+class UUIDInFilter(filters.BaseInFilter, filters.UUIDFilter):
+    pass
+
+
+class ProjectSummaryFilter(filters.FilterSet):
+    """
+    Filters on the project id itself, so `project__in` does not load every
+    listed project to validate it.
+    """
+    project = filters.UUIDFilter(field_name='project_id')
+    project__in = UUIDInFilter(field_name='project_id', lookup_expr='in')
+
+    class Meta:
+        model = ProjectSummary
+        fields = []
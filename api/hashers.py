@@ -0,0 +1,57 @@
+"""
+Password hashers with their cost parameters taken from
+`settings.PASSWORD_HASHER_PARAMS`, so the login cost can be tuned per
+deployment. They keep Django's algorithm names and hash formats, so hashes
+stay interchangeable with the stock hashers. Changing a parameter rehashes
+each password on its next successful login (`must_update`).
+"""
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_HASHER_PARAMS['scrypt']['work_factor']
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_HASHER_PARAMS['scrypt']['block_size']
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_HASHER_PARAMS['scrypt']['parallelism']
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        # OpenSSL refuses more than 32 MiB by default while scrypt needs
+        # 128 * n * r bytes; allow twice that for the hash being checked
+        hash_ = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+                               maxmem=256 * n * r, dklen=64)
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id, the default of `Argon2PasswordHasher`. Needs argon2-cffi.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_HASHER_PARAMS['argon2']['time_cost']
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_HASHER_PARAMS['argon2']['memory_cost']
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_HASHER_PARAMS['argon2']['parallelism']
@@ -0,0 +1,23 @@
+def collect_related_objects(objects, projects=None, users=None):
+    """
+    Collect the distinct projects and users referenced by `objects` through
+    `project`, `user` and `created_by` (including `project.created_by`).
+    Relations are expected to be loaded with select_related already.
+    Returns two dicts keyed by primary key, in first-seen order; pass the
+    dicts of a previous call to add to them.
+    """
+    projects = {} if projects is None else projects
+    users = {} if users is None else users
+
+    def add_user(user):
+        if user is not None:
+            users.setdefault(user.pk, user)
+
+    for obj in objects:
+        project = getattr(obj, 'project', None)
+        if project is not None and project.pk not in projects:
+            projects[project.pk] = project
+            add_user(project.created_by)
+        add_user(getattr(obj, 'user', None))
+        add_user(getattr(obj, 'created_by', None))
+    return projects, users
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from api.archive import ArchiveInProgress, ColdStore, archive_hidden_rows
+
+
+class Command(BaseCommand):
+    help = ('Move the projects, project roles and comments hidden for longer than API_ARCHIVE_AFTER_DAYS '
+            'to gzipped JSON Lines files and delete them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--directory', default=settings.API_ARCHIVE_DIR, help='Where the archive files go.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches; the next run resumes.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows to archive.')
+
+    def handle(self, *args, **options):
+        try:
+            counts = archive_hidden_rows(
+                ColdStore(options['directory']), batch_size=options['batch_size'],
+                max_batches=options['max_batches'], dry_run=options['dry_run'], using=options['database'],
+            )
+        except ArchiveInProgress as e:
+            raise CommandError(str(e))
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        for label, count in counts.items():
+            self.stdout.write(f'{verb} {count} {label} rows')
@@ -0,0 +1,86 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import get_runner
+from django.conf import settings
+
+from api.benchmark import (
+    Scale, TRANSPORTS, seed, get_benchmark_user, get_credentials, get_scenarios,
+    run_benchmark, compare, benchmark_login, get_hasher_profiles, peak_rss_mb
+)
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database at the given scale, time every API scenario and '
+            'optionally compare the results with a stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--projects', type=int, default=1000)
+        parser.add_argument('--roles-per-project', type=int, default=3)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario.')
+        parser.add_argument('--transport', choices=sorted(TRANSPORTS), default='client')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run the named scenario (repeatable).')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the cache between requests instead of clearing it.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the seeded test database and reuse it on the next run (SQLite test '
+                                 'databases are in memory unless TEST NAME is set).')
+        parser.add_argument('--login', action='store_true',
+                            help='Time logins with each installed password hasher profile instead.')
+        parser.add_argument('--baseline', help='JSON results to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed p95 latency increase over the baseline, as a fraction.')
+        parser.add_argument('--save-baseline', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        runner = get_runner(settings)(keepdb=options['keepdb'], verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            if get_benchmark_user() is None:
+                scale = Scale(options['users'], options['projects'], options['roles_per_project'],
+                              options['comments'])
+                self.stdout.write(f'Seeding {scale}')
+                seed(scale)
+
+            if options['login']:
+                results = benchmark_login(TRANSPORTS[options['transport']](), get_benchmark_user(),
+                                          get_hasher_profiles(), iterations=options['iterations'])
+                self.write_login_results(results)
+                return
+
+            scenarios = get_scenarios()
+            if options['scenarios']:
+                scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+            results = run_benchmark(
+                TRANSPORTS[options['transport']](), scenarios, get_credentials(get_benchmark_user()),
+                iterations=options['iterations'], warmup=options['warmup'], warm_cache=options['warm_cache'],
+            )
+        finally:
+            runner.teardown_databases(old_config)
+
+        self.stdout.write(f'{"scenario":<24}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>9}{"+rss MB":>9}')
+        for name, result in results.items():
+            self.stdout.write(f'{name:<24}{result["p50_ms"]:>10.1f}{result["p95_ms"]:>10.1f}'
+                              f'{result["p99_ms"]:>10.1f}{result["queries"]:>9}{result["peak_rss_growth_mb"]:>9.1f}')
+        self.stdout.write(f'Peak RSS {peak_rss_mb():.1f} MB')
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = compare(results, json.load(f), threshold=options['threshold'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def write_login_results(self, results):
+        self.stdout.write(f'{"profile":<24}{"p50 ms":>10}{"p95 ms":>10}{"logins/s":>10}')
+        for profile, result in results.items():
+            self.stdout.write(f'{profile:<24}{result["p50_ms"]:>10.1f}{result["p95_ms"]:>10.1f}'
+                              f'{result["logins_per_s"]:>10.1f}')
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.schema import generate_schema, read_schema_file, write_schema_file
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema served at /api/v1/schema/ into API_SCHEMA_FILE.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only fail if the file does not match the schema generated from the code.')
+
+    def handle(self, *args, **options):
+        content = generate_schema()
+        if options['check']:
+            if read_schema_file() != content:
+                raise CommandError(f'{settings.API_SCHEMA_FILE} is out of date, run `manage.py build_schema`.')
+            self.stdout.write(f'{settings.API_SCHEMA_FILE} is up to date')
+            return
+
+        write_schema_file(content)
+        self.stdout.write(f'Wrote {settings.API_SCHEMA_FILE}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from api.search import get_search_indexes
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search documents of every indexed model.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        for index in get_search_indexes():
+            with transaction.atomic(using=using):
+                index.rebuild(using=using)
+            self.stdout.write(f'Rebuilt {index.table}')
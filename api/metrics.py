@@ -0,0 +1,243 @@
+"""
+Per-request instrumentation: SQL count, SQL time, serialization time and
+total latency.
+
+`MetricsMiddleware` measures a sample of the requests
+(`settings.API_METRICS_SAMPLE_RATE`), adds a `Server-Timing` header to them
+and records them in histograms labelled by view and method, which `/metrics`
+exposes in the Prometheus text format. Unsampled requests only pay for one
+random draw and a context variable lookup per query.
+
+Queries are counted by an execute wrapper installed on every connection as it
+is opened; the measurement is kept in a context variable, so queries run
+through `sync_to_async` by async views are counted too.
+
+Histograms live in the memory of each process; with several workers each one
+is scraped (or exposes) its own series.
+"""
+import bisect
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """
+    Cumulative histogram with one series per label values tuple.
+    """
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # one count per bucket plus +Inf, then the sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0]
+            series[index] += 1
+            series[-1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(self.labelnames, labels))
+            count = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), values):
+                count += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return '\n'.join(lines)
+
+
+def escape_label(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds', 'Total time to produce the response.',
+    ['view', 'method'], LATENCY_BUCKETS
+)
+DB_QUERIES = Histogram(
+    'api_request_db_queries', 'SQL statements executed per request.',
+    ['view', 'method'], QUERY_COUNT_BUCKETS
+)
+DB_DURATION = Histogram(
+    'api_request_db_duration_seconds', 'Time spent executing SQL per request.',
+    ['view', 'method'], LATENCY_BUCKETS
+)
+SERIALIZATION_DURATION = Histogram(
+    'api_request_serialization_seconds',
+    'Time spent in the view and renderer outside the database: building and rendering the representation.',
+    ['view', 'method'], LATENCY_BUCKETS
+)
+
+HISTOGRAMS = [REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZATION_DURATION]
+
+
+class RequestMetrics:
+    """
+    The measurements of one sampled request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.db_before_view = 0.0
+        self.query_count = 0
+        self.db_time = 0.0
+
+    def record_query(self, duration):
+        self.query_count += 1
+        self.db_time += duration
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def get_request_metrics():
+    """
+    Return the `RequestMetrics` of the request being measured, or `None`.
+    """
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # the wrapper list outlives reconnections
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    # the dotted path of the view when the route has no name
+    return match.view_name
+
+
+@sync_and_async_middleware
+class MetricsMiddleware:
+    """
+    Measure a sample of the requests; see the module docstring.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.is_sampled(request):
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.is_sampled(request):
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def is_sampled(self, request):
+        rate = settings.API_METRICS_SAMPLE_RATE
+        return rate >= 1 or random.random() < rate
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
+            metrics.db_before_view = metrics.db_time
+
+    def finish(self, request, response, metrics):
+        finished = time.perf_counter()
+        total = finished - metrics.started
+        serialization = 0.0
+        if metrics.view_started is not None:
+            view_db_time = metrics.db_time - metrics.db_before_view
+            serialization = max(0.0, finished - metrics.view_started - view_db_time)
+
+        labels = (get_view_name(request), request.method)
+        REQUEST_DURATION.observe(labels, total)
+        DB_QUERIES.observe(labels, metrics.query_count)
+        DB_DURATION.observe(labels, metrics.db_time)
+        SERIALIZATION_DURATION.observe(labels, serialization)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.query_count} queries"',
+            f'serialize;dur={serialization * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        return response
+
+
+def expose_metrics():
+    return '\n'.join(histogram.expose() for histogram in HISTOGRAMS) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Requires `Authorization: Bearer <token>` when
+    `settings.API_METRICS_TOKEN` is set, and is refused without a token
+    unless `settings.API_METRICS_PUBLIC` is set.
+    """
+    token = settings.API_METRICS_TOKEN
+    if not token and not settings.API_METRICS_PUBLIC:
+        return HttpResponseForbidden()
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    response = HttpResponse(expose_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    patch_vary_headers(response, ['Authorization'])
+    return response
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_remove_customuser_is_admin'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['-created_at', '-id'], name='api_comment_vis_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['project', '-created_at'], name='api_comment_proj_vis_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['-created_at', '-id'], name='api_project_vis_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectrole',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['-created_at', '-id'], name='api_projectrole_vis_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectrole',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['project', '-created_at'], name='api_prole_proj_vis_crt_idx'),
+        ),
+    ]
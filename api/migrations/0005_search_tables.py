@@ -0,0 +1,88 @@
+import re
+
+from django.db import migrations
+
+# the search tables of api/search.py, with frozen copies of its index fields
+# and tokenizer at the time of this migration
+SOURCE_TABLES = ['api_project', 'api_projectrole', 'api_comment']
+
+INDEX_FIELDS = {
+    'Project': ['name', 'description', 'created_by__first_name', 'created_by__last_name',
+                'created_by__email'],
+    'ProjectRole': ['user__first_name', 'user__last_name', 'user__email', 'project__name',
+                    'project__description', 'role'],
+    'Comment': ['project__name', 'project__description', 'user__first_name', 'user__last_name',
+                'user__email', 'text'],
+}
+
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+CREATE_STATEMENTS = {
+    'sqlite': [
+        'CREATE TABLE "{table}" ("id" integer PRIMARY KEY, "object_id" text NOT NULL UNIQUE, '
+        '"document" text NOT NULL)',
+        'CREATE VIRTUAL TABLE "{table}_fts" USING fts5(document, content="{table}", content_rowid="id", '
+        'tokenize="unicode61 remove_diacritics 2", prefix="2 3")',
+        'CREATE TRIGGER "{table}_ai" AFTER INSERT ON "{table}" BEGIN '
+        'INSERT INTO "{table}_fts"(rowid, document) VALUES (new.id, new.document); END',
+        'CREATE TRIGGER "{table}_ad" AFTER DELETE ON "{table}" BEGIN '
+        'INSERT INTO "{table}_fts"("{table}_fts", rowid, document) VALUES (\'delete\', old.id, old.document); END',
+    ],
+    'postgresql': [
+        'CREATE TABLE "{table}" ("object_id" uuid PRIMARY KEY REFERENCES "{source_table}" ("id") '
+        'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "document" tsvector NOT NULL)',
+        'CREATE INDEX "{table}_document_idx" ON "{table}" USING GIN ("document")',
+    ],
+}
+
+DROP_STATEMENTS = {
+    'sqlite': ['DROP TABLE IF EXISTS "{table}_fts"', 'DROP TABLE IF EXISTS "{table}"'],
+    'postgresql': ['DROP TABLE IF EXISTS "{table}"'],
+}
+
+INSERT_STATEMENTS = {
+    'sqlite': 'INSERT INTO "{table}" (object_id, document) VALUES (%s, %s)',
+    'postgresql': 'INSERT INTO "{table}" (object_id, document) VALUES (%s, to_tsvector(\'simple\', %s))',
+}
+
+
+def create_search_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    vendor = connection.vendor
+    if vendor not in CREATE_STATEMENTS:
+        return
+    for source_table in SOURCE_TABLES:
+        for statement in CREATE_STATEMENTS[vendor]:
+            schema_editor.execute(statement.format(table=f'{source_table}_search', source_table=source_table))
+
+    using = connection.alias
+    for model_name, fields in INDEX_FIELDS.items():
+        model = apps.get_model('api', model_name)
+        rows = model.objects.using(using).filter(is_visible=True).values_list('pk', *fields)
+        documents = [
+            (model._meta.pk.get_db_prep_value(pk, connection),
+             ' '.join(token for value in values if value is not None for token in TOKEN_RE.findall(str(value).lower())))
+            for pk, *values in rows.iterator(chunk_size=1000)
+        ]
+        if documents:
+            with connection.cursor() as cursor:
+                cursor.executemany(INSERT_STATEMENTS[vendor].format(table=f'{model._meta.db_table}_search'),
+                                   documents)
+
+
+def drop_search_tables(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for source_table in SOURCE_TABLES:
+        for statement in DROP_STATEMENTS.get(vendor, []):
+            schema_editor.execute(statement.format(table=f'{source_table}_search'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_visible_created_at_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
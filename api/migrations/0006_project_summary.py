@@ -0,0 +1,75 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+ROLE_COUNT_FIELDS = {
+    'OWNER': 'owner_count',
+    'EDITOR': 'editor_count',
+    'READER': 'reader_count',
+}
+
+
+def create_summaries(apps, schema_editor):
+    """
+    Build the summaries of the existing projects from their rows, with the
+    historical models so later changes to `api.summaries` do not affect it.
+    """
+    Project = apps.get_model('api', 'Project')
+    ProjectRole = apps.get_model('api', 'ProjectRole')
+    Comment = apps.get_model('api', 'Comment')
+    ProjectSummary = apps.get_model('api', 'ProjectSummary')
+    using = schema_editor.connection.alias
+
+    summaries = {
+        pk: ProjectSummary(project_id=pk, last_activity_at=updated_at)
+        for pk, updated_at in Project.objects.using(using).values_list('pk', 'updated_at')
+    }
+
+    def record_activity(project_id, last_activity_at):
+        summary = summaries.get(project_id)
+        if summary is not None and last_activity_at is not None:
+            summary.last_activity_at = max(filter(None, [summary.last_activity_at, last_activity_at]))
+
+    comments = (Comment.objects.using(using).filter(project__isnull=False)
+                .values('project_id')
+                .annotate(count=models.Count('pk', filter=models.Q(is_visible=True)),
+                          last_activity_at=models.Max('updated_at'))
+                .values_list('project_id', 'count', 'last_activity_at'))
+    for project_id, count, last_activity_at in comments:
+        summaries[project_id].comment_count = count
+        record_activity(project_id, last_activity_at)
+
+    roles = (ProjectRole.objects.using(using).filter(project__isnull=False)
+             .values('project_id', 'role')
+             .annotate(count=models.Count('pk', filter=models.Q(is_visible=True)),
+                       last_activity_at=models.Max('updated_at'))
+             .values_list('project_id', 'role', 'count', 'last_activity_at'))
+    for project_id, role, count, last_activity_at in roles:
+        if role in ROLE_COUNT_FIELDS:
+            setattr(summaries[project_id], ROLE_COUNT_FIELDS[role], count)
+        record_activity(project_id, last_activity_at)
+
+    ProjectSummary.objects.using(using).bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_search_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectSummary',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='api.project')),
+                ('comment_count', models.IntegerField(default=0)),
+                ('owner_count', models.IntegerField(default=0)),
+                ('editor_count', models.IntegerField(default=0)),
+                ('reader_count', models.IntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_project_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['updated_at', 'id'], name='api_comment_upd_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['updated_at', 'id'], name='api_project_upd_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectrole',
+            index=models.Index(fields=['updated_at', 'id'], name='api_projectrole_upd_id_idx'),
+        ),
+    ]
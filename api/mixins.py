@@ -1,9 +1,857 @@
+import hashlib
+import inspect
+from datetime import datetime, timedelta
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.functional import classproperty
+from django.utils import timezone
+from django.utils.http import http_date, quote_etag, urlsafe_base64_decode, urlsafe_base64_encode
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .archive import get_archive_horizon
+from .caching import get_generations, get_response_cache_key
+from .fast_serializers import get_values_plan
+from .helpers import collect_related_objects
+from .pagination import CustomCursorPagination
+from .serializers import FieldSelectionMixin, ProjectCompactSerializer, UserInfoSerialzer
+
+
 class DisablePaginationMixin:
     """
     A mixin to disable pagination dynamically based on a query parameter.
+
+    Unpaginated lists are streamed from a server-side cursor instead of being
+    loaded and rendered in one go, either as a JSON array (default) or as
+    NDJSON when `streamFormat=ndjson` is passed or `application/x-ndjson` is
+    accepted.
     """
+    stream_chunk_size = 2000
+    stream_batch_size = 100
+    ndjson_media_type = 'application/x-ndjson'
+
+    def pagination_disabled(self):
+        return self.request.query_params.get('disablePagination', '').lower() == 'true'
+
     def paginate_queryset(self, queryset):
-        disable_pagination = self.request.query_params.get('disablePagination', '').lower() == 'true'
-        if disable_pagination:
+        if self.pagination_disabled():
             return None
         return super().paginate_queryset(queryset)
+
+    async def apaginate_queryset(self, queryset):
+        if self.pagination_disabled():
+            return None
+        return await super().apaginate_queryset(queryset)
+
+    def list(self, request, *args, **kwargs):
+        if not self.pagination_disabled():
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.get_streaming_response(self.iter_stream_rows(queryset))
+
+    async def alist(self, request, *args, **kwargs):
+        if not self.pagination_disabled():
+            return await super().alist(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.get_streaming_response(self.aiter_stream_rows(queryset))
+
+    def iter_stream_rows(self, queryset):
+        # a single serializer instance is reused for every row
+        serializer = self.get_serializer()
+        for instance in queryset.iterator(chunk_size=self.stream_chunk_size):
+            yield serializer.to_representation(instance)
+
+    async def aiter_stream_rows(self, queryset):
+        serializer = self.get_serializer()
+        async for instance in queryset.aiterator(chunk_size=self.stream_chunk_size):
+            yield serializer.to_representation(instance)
+
+    def wants_ndjson(self):
+        stream_format = self.request.query_params.get('streamFormat', '').lower()
+        if stream_format:
+            return stream_format == 'ndjson'
+        return self.ndjson_media_type in self.request.META.get('HTTP_ACCEPT', '')
+
+    def get_streaming_response(self, rows):
+        """
+        Stream `rows`, an iterator or (from async views) an async iterator.
+        """
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        is_async = hasattr(rows, '__aiter__')
+        if self.wants_ndjson():
+            iter_content, content_type = (self.aiter_ndjson if is_async else self.iter_ndjson), self.ndjson_media_type
+        else:
+            iter_content, content_type = (self.aiter_json_array if is_async else self.iter_json_array), 'application/json'
+        return StreamingHttpResponse(iter_content(rows, encoder), content_type=content_type)
+
+    def iter_ndjson(self, rows, encoder):
+        for batch in self.iter_batches(rows):
+            yield ''.join(encoder.encode(row) + '\n' for row in batch)
+
+    def iter_json_array(self, rows, encoder):
+        yield '['
+        separator = ''
+        for batch in self.iter_batches(rows):
+            yield separator + ','.join(encoder.encode(row) for row in batch)
+            separator = ','
+        yield ']'
+
+    def iter_batches(self, rows):
+        # group rows so each write to the socket carries a reasonable payload
+        rows = iter(rows)
+        while batch := list(islice(rows, self.stream_batch_size)):
+            yield batch
+
+    async def aiter_ndjson(self, rows, encoder):
+        async for batch in self.aiter_batches(rows):
+            yield ''.join(encoder.encode(row) + '\n' for row in batch)
+
+    async def aiter_json_array(self, rows, encoder):
+        yield '['
+        separator = ''
+        async for batch in self.aiter_batches(rows):
+            yield separator + ','.join(encoder.encode(row) for row in batch)
+            separator = ','
+        yield ']'
+
+    async def aiter_batches(self, rows):
+        batch = []
+        async for row in rows:
+            batch.append(row)
+            if len(batch) == self.stream_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def get_cursor_fields(view, queryset):
+    """
+    Return the fields a cursor position is read from when `view` paginates
+    with `CustomCursorPagination`, so narrowed querysets keep loading them.
+    """
+    if not isinstance(view.paginator, CustomCursorPagination):
+        return []
+    return [field.lstrip('-') for field in view.paginator.get_ordering(view.request, queryset, view)]
+
+
+class SparseFieldsMixin:
+    """
+    A mixin to narrow GET responses based on the `fields` and `expand` query
+    parameters, for serializers built on `FieldSelectionMixin`.
+
+    `fields=id,name` keeps those fields only; nested relations are then
+    rendered as ids unless listed in `expand` (`expand=project`), which also
+    selects them. The same selection prunes the SQL: `.values()` rows read
+    the plan's columns only, and instance querysets are narrowed with
+    `.only()` and join the expanded relations alone.
+    """
+
+    def get_field_selection(self):
+        """
+        Return the `fields`/`expand` serializer kwargs of the request, or
+        `None` when it selects nothing.
+        """
+        if not hasattr(self, '_field_selection'):
+            self._field_selection = self.parse_field_selection()
+        return self._field_selection
+
+    def parse_field_selection(self):
+        request = getattr(self, 'request', None)
+        if request is None or not ({'fields', 'expand'} & request.query_params.keys()):
+            return None
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, FieldSelectionMixin):
+            return None
+
+        available = serializer_class().fields
+        relations = {name for name, field in available.items() if isinstance(field, BaseSerializer)}
+        fields = {name.strip() for name in request.query_params.get('fields', '').split(',') if name.strip()}
+        expand = {name.strip() for name in request.query_params.get('expand', '').split(',') if name.strip()}
+        unknown = sorted(fields - available.keys()) + sorted(expand - relations)
+        if unknown:
+            raise ParseError(f'Unknown fields: {", ".join(unknown)}.')
+
+        selected = (fields | expand) if fields else available.keys()
+        # in the serializer's order, so equal selections share a cached plan
+        return {
+            'fields': tuple(name for name in available if name in selected),
+            'expand': tuple(name for name in available if name in expand),
+        }
+
+    def get_serializer(self, *args, **kwargs):
+        selection = self.get_field_selection()
+        if selection is not None:
+            kwargs.update(selection)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_values_plan(self):
+        selection = self.get_field_selection()
+        if selection is None or not self.values_serialization:
+            return super().get_values_plan()
+        serializer_class = self.get_serializer_class()
+        cache_key = (serializer_class, selection['fields'], selection['expand'])
+        return get_values_plan(serializer_class(**selection), cache_key=cache_key)
+
+    def filter_queryset(self, queryset):
+        # views override get_queryset, so the narrowing is done here
+        queryset = super().filter_queryset(queryset)
+        selection = self.get_field_selection()
+        if selection is None:
+            return queryset
+
+        try:
+            only, related = self.get_selected_paths(queryset.model, self.get_serializer_class()(**selection))
+        except FieldDoesNotExist:
+            # fields not backed by a column may read anything
+            return queryset
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*only, *get_cursor_fields(self, queryset))
+
+    def get_selected_paths(self, model, serializer, prefix=''):
+        """
+        Return the `.only()` paths and the `select_related` paths of the
+        columns `serializer` reads.
+        """
+        only, related = [], []
+        for field in serializer._readable_fields:
+            if len(field.source_attrs) != 1:
+                raise FieldDoesNotExist(field.source)
+            model_field = model._meta.get_field(field.source_attrs[0])
+            if not model_field.concrete or model_field.many_to_many:
+                raise FieldDoesNotExist(field.source)
+            path = prefix + model_field.name
+            only.append(path)
+            if isinstance(field, BaseSerializer):
+                related.append(path)
+                nested_only, nested_related = self.get_selected_paths(
+                    model_field.related_model, field, prefix=path + '__')
+                only.extend(nested_only)
+                related.extend(nested_related)
+        return only, related
+
+
+class ValuesSerializationMixin:
+    """
+    A mixin to serve list responses from `.values()` rows through a
+    precompiled `ValuesPlan` instead of model instances and the
+    `ModelSerializer` field machinery. The output is identical; serializers
+    the plan can not reproduce fall back to the regular path. Unpaginated
+    lists stream the same rows (see `DisablePaginationMixin`).
+    """
+    values_serialization = True
+
+    def get_values_plan(self):
+        if not self.values_serialization:
+            return None
+        # compiled without context so the cached plan does not pin a request
+        return get_values_plan(self.get_serializer_class()())
+
+    def get_values_queryset(self, queryset, plan):
+        columns = list(plan.columns)
+        columns.extend(field for field in get_cursor_fields(self, queryset) if field not in plan.columns)
+        return queryset.values(*columns)
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_values_plan()
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.get_values_queryset(self.filter_queryset(self.get_queryset()), plan)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            # unpaginated lists are streamed, see DisablePaginationMixin
+            rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+            return self.get_streaming_response(plan.iter_rows(rows))
+        return self.get_paginated_response(plan.serialize_rows(page))
+
+    async def alist(self, request, *args, **kwargs):
+        plan = self.get_values_plan()
+        if plan is None:
+            return await super().alist(request, *args, **kwargs)
+
+        queryset = self.get_values_queryset(self.filter_queryset(self.get_queryset()), plan)
+        page = await self.apaginate_queryset(queryset)
+        if page is None:
+            to_representation = plan.bind()
+            rows = (to_representation(row) async for row in queryset.aiterator(chunk_size=self.stream_chunk_size))
+            return self.get_streaming_response(rows)
+        return self.get_paginated_response(plan.serialize_rows(page))
+
+
+class DeltaSyncMixin:
+    """
+    A mixin to return the rows changed since a previous sync based on the
+    `since` query parameter, so clients keep a local copy without reloading
+    the whole list.
+
+    `since=` (empty) starts from scratch. Rows come in `(updated_at, id)`
+    order, `sync_batch_size` at a time, once they are older than
+    `settings.API_SYNC_LAG_SECONDS` so that transactions still in flight
+    can not commit behind the watermark: visible rows in `results`, soft
+    deleted ones as ids in `deleted`, with the `since` token of the next
+    request and whether `more` rows are waiting. Soft deletes bump
+    `updated_at` like any other write; hard deleted rows are not reported,
+    so tokens whose sync started before the archive horizon (see
+    `api/archive.py`) are answered with 410 Gone and the client starts over.
+    Tokens carry that start: the time of the first page of an initial sync,
+    or of the last page with no `more` rows.
+    """
+    sync_batch_size = 500
+
+    def sync_requested(self):
+        return 'since' in self.request.query_params
+
+    def list(self, request, *args, **kwargs):
+        if not self.sync_requested():
+            return super().list(request, *args, **kwargs)
+        return self.sync_list(request)
+
+    async def alist(self, request, *args, **kwargs):
+        if not self.sync_requested():
+            return await super().alist(request, *args, **kwargs)
+        return await sync_to_async(self.sync_list)(request)
+
+    def get_sync_queryset(self):
+        # tombstones included
+        queryset = self.get_queryset().model.objects.all()
+        # search and ordering do not apply to a sync
+        for backend in self.filter_backends:
+            if not issubclass(backend, (SearchFilter, OrderingFilter)):
+                queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset
+
+    def encode_since(self, updated_at, pk, started_at):
+        return urlsafe_base64_encode(f'{updated_at.isoformat()}|{pk}|{started_at.isoformat()}'.encode())
+
+    def decode_since(self, token):
+        """
+        Return the `(updated_at, pk, started_at)` of the last row of the
+        previous sync and the start of that sync, or `None` for an initial
+        sync.
+        """
+        if not token:
+            return None
+        try:
+            parts = urlsafe_base64_decode(token).decode().split('|')
+            # tokens issued before the start was recorded count from their last row
+            updated_at, pk, started_at = parts if len(parts) == 3 else (*parts, parts[0])
+            return (datetime.fromisoformat(updated_at), self.get_queryset().model._meta.pk.to_python(pk),
+                    datetime.fromisoformat(started_at))
+        except (TypeError, ValueError, ValidationError):
+            raise ParseError('Invalid since token.')
+
+    def sync_list(self, request):
+        token = request.query_params['since']
+        queryset = self.get_sync_queryset()
+        since = self.decode_since(token)
+        # rows newer than the cutoff wait for the next sync
+        cutoff = started_at = timezone.now() - timedelta(seconds=settings.API_SYNC_LAG_SECONDS)
+        queryset = queryset.filter(updated_at__lt=cutoff)
+        if since is not None:
+            updated_at, pk, started_at = since
+            if started_at < get_archive_horizon():
+                return Response({'detail': 'The since token has expired, sync again from scratch.'},
+                                status=status.HTTP_410_GONE)
+            # the range on updated_at alone lets the (updated_at, id) index seek
+            queryset = queryset.filter(Q(updated_at__gt=updated_at) | Q(pk__gt=pk), updated_at__gte=updated_at)
+        queryset = queryset.order_by('updated_at', 'pk')[:self.sync_batch_size + 1]
+
+        plan = self.get_values_plan()
+        if plan is None:
+            to_representation = self.get_serializer().to_representation
+            rows = [(obj.pk, obj.updated_at, obj.is_visible, obj) for obj in queryset]
+        else:
+            to_representation = plan.bind()
+            pk_name = queryset.model._meta.pk.name
+            columns = dict.fromkeys([*plan.columns, pk_name, 'updated_at', 'is_visible'])
+            rows = [(row[pk_name], row['updated_at'], row['is_visible'], row) for row in queryset.values(*columns)]
+
+        more = len(rows) > self.sync_batch_size
+        rows = rows[:self.sync_batch_size]
+        if not more:
+            # the client is up to date, later tombstones are newer than the cutoff
+            started_at = cutoff
+        if rows:
+            pk, updated_at = rows[-1][:2]
+        if rows or since is not None:
+            token = self.encode_since(updated_at, pk, started_at)
+        return Response({
+            'results': [to_representation(row) for pk, updated_at, visible, row in rows if visible],
+            'deleted': [pk for pk, updated_at, visible, row in rows if not visible],
+            'since': token,
+            'more': more,
+        })
+
+
+class CursorPaginationMixin:
+    """
+    A mixin to switch to keyset (cursor) pagination based on a query parameter.
+    Requests carrying `cursorPagination=true` (or a `cursor` from a previous
+    page) are paginated with `cursor_pagination_class` instead of the default
+    page number pagination.
+    """
+    cursor_pagination_class = CustomCursorPagination
+
+    def use_cursor_pagination(self):
+        request = getattr(self, 'request', None)
+        if request is None:
+            return False
+        query_params = getattr(request, 'query_params', request.GET)
+        cursor_pagination = query_params.get('cursorPagination', '').lower() == 'true'
+        return cursor_pagination or self.cursor_pagination_class.cursor_query_param in query_params
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.use_cursor_pagination():
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+
+class CompactRepresentationMixin:
+    """
+    A mixin to return a flat list representation based on a query parameter.
+    With `compact=true` rows reference projects and users by id, and every
+    referenced project and user is listed once in an `included` side-table.
+
+    Unpaginated compact lists (see `DisablePaginationMixin`) are streamed as
+    the same JSON object, with `included` after the rows.
+    """
+    compact_serializer_class = None
+
+    def compact_representation_requested(self):
+        if self.compact_serializer_class is None:
+            return False
+        return self.request.query_params.get('compact', '').lower() == 'true'
+
+    def list(self, request, *args, **kwargs):
+        if not self.compact_representation_requested():
+            return super().list(request, *args, **kwargs)
+        if self.pagination_disabled():
+            queryset = self.get_compact_queryset(request)
+            return self.get_compact_streaming_response(
+                self.iter_compact_json(queryset.iterator(chunk_size=self.stream_chunk_size))
+            )
+        return self.compact_list(request)
+
+    async def alist(self, request, *args, **kwargs):
+        if not self.compact_representation_requested():
+            return await super().alist(request, *args, **kwargs)
+        if self.pagination_disabled():
+            queryset = self.get_compact_queryset(request)
+            return self.get_compact_streaming_response(
+                self.aiter_compact_json(queryset.aiterator(chunk_size=self.stream_chunk_size))
+            )
+        return await sync_to_async(self.compact_list)(request)
+
+    def get_compact_queryset(self, request):
+        if {'fields', 'expand'} & request.query_params.keys():
+            raise ParseError('fields and expand do not apply to the compact representation.')
+        return self.filter_queryset(self.get_queryset())
+
+    def compact_list(self, request):
+        queryset = self.get_compact_queryset(request)
+        page = self.paginate_queryset(queryset)
+        objects = list(queryset if page is None else page)
+
+        context = self.get_serializer_context()
+        results = self.compact_serializer_class(objects, many=True, context=context).data
+        included = self.get_included(objects, context)
+
+        if page is None:
+            return Response({'results': results, 'included': included})
+        response = self.get_paginated_response(results)
+        response.data['included'] = included
+        return response
+
+    def get_included(self, objects, context):
+        return self.serialize_included(*collect_related_objects(objects), context)
+
+    def serialize_included(self, projects, users, context):
+        return {
+            'projects': ProjectCompactSerializer(projects.values(), many=True, context=context).data,
+            'users': UserInfoSerialzer(users.values(), many=True, context=context).data,
+        }
+
+    def get_compact_streaming_response(self, content):
+        if self.request.query_params.get('streamFormat', '').lower() == 'ndjson':
+            raise ParseError('The compact representation is streamed as JSON only.')
+        return StreamingHttpResponse(content, content_type='application/json')
+
+    def iter_compact_json(self, instances):
+        # only the distinct projects and users of `included` are kept in memory
+        context = self.get_serializer_context()
+        serializer = self.compact_serializer_class(context=context)
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        projects, users = {}, {}
+        yield '{"results":['
+        separator = ''
+        for batch in self.iter_batches(instances):
+            collect_related_objects(batch, projects, users)
+            yield separator + ','.join(encoder.encode(serializer.to_representation(obj)) for obj in batch)
+            separator = ','
+        yield '],"included":' + encoder.encode(self.serialize_included(projects, users, context)) + '}'
+
+    async def aiter_compact_json(self, instances):
+        context = self.get_serializer_context()
+        serializer = self.compact_serializer_class(context=context)
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        projects, users = {}, {}
+        yield '{"results":['
+        separator = ''
+        async for batch in self.aiter_batches(instances):
+            collect_related_objects(batch, projects, users)
+            yield separator + ','.join(encoder.encode(serializer.to_representation(obj)) for obj in batch)
+            separator = ','
+        yield '],"included":' + encoder.encode(self.serialize_included(projects, users, context)) + '}'
+
+
+class ResponseCacheMixin:
+    """
+    A mixin to cache rendered list responses.
+
+    Entries are keyed by the normalized query parameters, the negotiated media
+    type, the user's visibility scope and the generations of
+    `cache_dependencies`, so any write to one of those models invalidates
+    them. Responses carry ETag/Last-Modified and conditional requests are
+    answered with 304 Not Modified.
+    """
+    cache_dependencies = ()
+    response_cache = True
+
+    def get_cache_scope(self, request):
+        # every authenticated user currently sees the same visible objects
+        return 'visible'
+
+    def response_cache_enabled(self, request):
+        if not (self.response_cache and self.cache_dependencies) or request.method != 'GET':
+            return False
+        # the generations of another process's cache would not see this one's writes
+        if not settings.API_CACHE_SHARED:
+            return False
+        if 'since' in request.query_params:
+            # rows join a sync as they age past its lag, without any write
+            return False
+        return request.query_params.get('disablePagination', '').lower() != 'true'
+
+    def get_cache_entry(self, request):
+        """
+        Return the cached entry for `request`. On a miss, prepare the entry
+        that `finalize_response` fills in and return `None`.
+        """
+        generations = get_generations(self.cache_dependencies)
+        key = get_response_cache_key(
+            type(self).__name__, generations,
+            sorted((name, sorted(values)) for name, values in request.query_params.lists()),
+            request.build_absolute_uri('/'),
+            request.accepted_media_type,
+            self.get_cache_scope(request),
+        )
+        entry = cache.get(key)
+        if entry is None:
+            self._response_cache_entry = {'key': key, 'last_modified': max(generations) // 10 ** 9}
+        return entry
+
+    def get_cached_response(self, request, entry):
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        return self.conditional_response(request, response, entry)
+
+    def list(self, request, *args, **kwargs):
+        if self.response_cache_enabled(request):
+            entry = self.get_cache_entry(request)
+            if entry is not None:
+                return self.get_cached_response(request, entry)
+        return super().list(request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        if self.response_cache_enabled(request):
+            entry = await sync_to_async(self.get_cache_entry)(request)
+            if entry is not None:
+                return self.get_cached_response(request, entry)
+        return await super().alist(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        entry = getattr(self, '_response_cache_entry', None)
+        if entry is None or response.status_code != 200 or response.streaming:
+            return response
+
+        response.render()
+        entry.update(
+            content=response.content,
+            content_type=response['Content-Type'],
+            etag=quote_etag(hashlib.sha256(response.content).hexdigest()),
+        )
+        cache.set(entry.pop('key'), entry, timeout=settings.API_RESPONSE_CACHE_TIMEOUT)
+        return self.conditional_response(request, response, entry)
+
+    async def afinalize_response(self, request, response, *args, **kwargs):
+        if getattr(self, '_response_cache_entry', None) is None:
+            return await super().afinalize_response(request, response, *args, **kwargs)
+        # storing the rendered response talks to the cache backend
+        return await sync_to_async(self.finalize_response)(request, response, *args, **kwargs)
+
+    def conditional_response(self, request, response, entry):
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        not_modified = get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified'], response=response
+        )
+        return not_modified or response
+
+
+class ConditionalRequestMixin:
+    """
+    A mixin to answer conditional requests on detail views from a cheap
+    `values()` probe of the `etag_fields` timestamps instead of loading and
+    serializing the object.
+
+    GET honours If-None-Match / If-Modified-Since with 304 Not Modified, and
+    PUT/DELETE honour If-Match / If-Unmodified-Since with 412 Precondition
+    Failed. `etag_fields` should list the `updated_at` of every object that
+    appears in the representation.
+    """
+    etag_fields = ('updated_at',)
+
+    def get_validators_queryset(self, lock=False):
+        """
+        Return the probe queryset, or `None` if the lookup value is invalid.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, ValidationError):
+            return None
+        if lock:
+            queryset = queryset.select_for_update(of=('self',))
+        return queryset.values_list('pk', *self.etag_fields)
+
+    def get_validators(self, lock=False):
+        """
+        Return `(etag, last_modified)` for the requested object, or `None` if
+        it does not exist.
+        """
+        queryset = self.get_validators_queryset(lock)
+        return None if queryset is None else self.make_validators(queryset.first())
+
+    async def aget_validators(self):
+        queryset = self.get_validators_queryset()
+        return None if queryset is None else self.make_validators(await queryset.afirst())
+
+    def make_validators(self, row):
+        if row is None:
+            return None
+
+        timestamps = [value for value in row[1:] if value is not None]
+        etag = quote_etag(hashlib.sha256(repr(row).encode()).hexdigest())
+        last_modified = int(max(timestamps).timestamp()) if timestamps else None
+        return etag, last_modified
+
+    def set_validator_headers(self, response, validators):
+        etag, last_modified = validators
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_not_modified_response(self, request, validators):
+        # object permissions in this API always allow safe methods, so the
+        # probe can answer without loading the object
+        if validators is None:
+            return None
+        etag, last_modified = validators
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return self.set_validator_headers(not_modified, validators)
+        return None
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        not_modified = self.get_not_modified_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().retrieve(request, *args, **kwargs)
+        if validators is not None:
+            self.set_validator_headers(response, validators)
+        return response
+
+    async def aretrieve(self, request, *args, **kwargs):
+        validators = await self.aget_validators()
+        not_modified = self.get_not_modified_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        response = await super().aretrieve(request, *args, **kwargs)
+        if validators is not None:
+            self.set_validator_headers(response, validators)
+        return response
+
+    def has_preconditions(self, request):
+        return 'HTTP_IF_MATCH' in request.META or 'HTTP_IF_UNMODIFIED_SINCE' in request.META
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            failed = self.check_preconditions(request)
+            if failed is not None:
+                return failed
+            response = super().update(request, *args, **kwargs)
+
+        validators = self.get_validators()
+        if validators is not None:
+            self.set_validator_headers(response, validators)
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            failed = self.check_preconditions(request)
+            if failed is not None:
+                return failed
+            return super().destroy(request, *args, **kwargs)
+
+    def get_object(self):
+        # check_preconditions may have loaded the object already
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def check_preconditions(self, request):
+        """
+        Return a 412 response if If-Match / If-Unmodified-Since do not hold.
+        The row is locked until the surrounding transaction ends. The object
+        permissions are checked first, so writers without access get 403
+        rather than learning the current version from a 412.
+        """
+        if not self.has_preconditions(request):
+            return None
+        validators = self.get_validators(lock=True)
+        if validators is None:
+            # let the regular lookup raise 404
+            return None
+        self.get_object()
+        etag, last_modified = validators
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+class AsyncViewMixin:
+    """
+    A mixin to run the view as an async view when `settings.API_ASYNC_VIEWS`
+    is set (the ASGI deployment).
+
+    Authentication, permission and throttle checks run in the request's sync
+    thread since they may touch the database. Handlers may return a response
+    or an awaitable; views built on this mixin route GET to async handlers
+    using the async ORM and other methods to their sync handlers through
+    `sync_to_async`.
+    """
+    async_views = None
+
+    @classproperty
+    def view_is_async(cls):
+        if cls.async_views is None:
+            return settings.API_ASYNC_VIEWS
+        return cls.async_views
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # the mode is fixed when the view function is built, as Django marks
+        # it as a coroutine function or not at that point
+        initkwargs.setdefault('async_views', cls.view_is_async)
+        return super().as_view(**initkwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.async_views:
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        # mirrors APIView.dispatch
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = await self.afinalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def afinalize_response(self, request, response, *args, **kwargs):
+        return self.finalize_response(request, response, *args, **kwargs)
+
+
+class AsyncListMixin(AsyncViewMixin):
+    """
+    Async counterpart of `ListModelMixin`; the list mixins above add their
+    own `alist` on top of it.
+    """
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer([instance async for instance in queryset], many=True)
+        return Response(serializer.data)
+
+
+class AsyncRetrieveMixin(AsyncViewMixin):
+    """
+    Async counterpart of `RetrieveModelMixin`.
+    """
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            instance = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, instance)
+        return instance
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
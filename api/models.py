@@ -1,9 +1,14 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, router, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.conf import settings
 
 import uuid
+from .caching import bump_generation
 from .managers import (
     DefaultManager,
     VisibleObjectManager,
@@ -11,6 +16,43 @@ from .managers import (
 )
 
 
+# Sent after set-based writes (bulk_create, bulk_update, queryset.update) that
+# bypass save() and post_save. Arguments: sender (the model), pks, instances
+# (the written objects when they were loaded, otherwise None) and created.
+rows_changed = Signal()
+
+# Sent after projects were hidden or restored together with their roles and
+# comments (see Project.bulk_soft_delete). Arguments: sender (Project), pks
+# and visible (the new visibility).
+project_visibility_changed = Signal()
+
+
+class LoadedValuesMixin:
+    """
+    Remembers the database values of an instance in `_loaded_values` so
+    signal receivers can tell what a save changed.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def remember_saved_values(self, update_fields=None):
+        # the saved values are now the database values
+        if update_fields is None:
+            deferred = self.get_deferred_fields()
+            saved = [field for field in self._meta.concrete_fields if field.attname not in deferred]
+        else:
+            saved = [field for field in self._meta.concrete_fields
+                     if field.name in update_fields or field.attname in update_fields]
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            **{field.attname: getattr(self, field.attname) for field in saved},
+        }
+
+
 class UserManager(BaseUserManager):
 
     use_in_migration = True
@@ -36,7 +78,7 @@ class UserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
 
 
-class CustomUser(AbstractUser):
+class CustomUser(LoadedValuesMixin, AbstractUser):
     USER_TYPE_CHOICES = (
         ('admin', 'admin'),
     )
@@ -66,9 +108,14 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return str(self.email)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        bump_generation(type(self), using=self._state.db)
+        self.remember_saved_values(kwargs.get('update_fields'))
+
 
 # base model which all models should inherit if id is a primary key
-class BaseModel(models.Model):
+class BaseModel(LoadedValuesMixin, models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     is_visible = models.BooleanField(default=True, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
@@ -80,10 +127,67 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+        indexes = [
+            # list views read visible_objects ordered by -created_at
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_visible=True),
+                         name='%(app_label)s_%(class)s_vis_crt_idx'),
+            # delta sync reads every row, tombstones included, by (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='%(app_label)s_%(class)s_upd_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        # post_save receivers (search index, project summaries) write in the
+        # same transaction as the row
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+        bump_generation(type(self), using=self._state.db)
+        self.remember_saved_values(kwargs.get('update_fields'))
+
+    def delete(self, *args, **kwargs):
+        using = self._state.db
+        with transaction.atomic(using=using, savepoint=False):
+            result = super().delete(*args, **kwargs)
+        bump_generation(type(self), using=using)
+        return result
 
     def soft_delete(self):
         self.is_visible = False
-        self.save()
+        self.save(update_fields=['is_visible', 'updated_at'])
+
+    @classmethod
+    def bulk_soft_delete(cls, pks):
+        """
+        Hide the visible rows in `pks` with a single UPDATE.
+        Returns the number of rows hidden.
+        """
+        with transaction.atomic():
+            count = cls.visible_objects.filter(pk__in=pks).update(is_visible=False, updated_at=timezone.now())
+            cls.notify_rows_changed(pks)
+        return count
+
+    def restore(self):
+        self.is_visible = True
+        self.save(update_fields=['is_visible', 'updated_at'])
+
+    @classmethod
+    def bulk_restore(cls, pks):
+        """
+        Show the hidden rows in `pks` again with a single UPDATE.
+        Returns the number of rows restored.
+        """
+        with transaction.atomic():
+            count = cls.non_visible_objects.filter(pk__in=pks).update(is_visible=True, updated_at=timezone.now())
+            cls.notify_rows_changed(pks)
+        return count
+
+    @classmethod
+    def notify_rows_changed(cls, pks, instances=None, created=False):
+        """
+        Run the side effects of save() for rows written without it.
+        """
+        bump_generation(cls)
+        rows_changed.send(sender=cls, pks=pks, instances=instances, created=created)
 
 
 # base model which all models should inherit if id is not a primary key
@@ -101,7 +205,7 @@ class NoIDBaseModel(models.Model):
 
     def soft_delete(self):
         self.is_visible = False
-        self.save()
+        self.save(update_fields=['is_visible', 'updated_at'])
 
 
 class Project(BaseModel):
@@ -113,6 +217,69 @@ class Project(BaseModel):
     def __str__(self):
         return str(self.name)
 
+    def soft_delete(self):
+        type(self).bulk_soft_delete([self.pk])
+        self.is_visible = False
+
+    def restore(self):
+        type(self).bulk_restore([self.pk])
+        self.is_visible = True
+
+    @classmethod
+    def get_cascade_models(cls):
+        return [ProjectRole, Comment]
+
+    @classmethod
+    def bulk_soft_delete(cls, pks):
+        """
+        Hide the visible projects in `pks` with their roles and comments, one
+        UPDATE per table. All rows get the same `updated_at`, which is how
+        `bulk_restore` tells the children hidden with their project.
+        Returns the number of projects hidden.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            # the children of already hidden projects were hidden with them or
+            # before; hiding them again would lose their project's updated_at
+            pks = list(cls.visible_objects.select_for_update().filter(pk__in=pks).values_list('pk', flat=True))
+            if not pks:
+                return 0
+            count = cls.objects.filter(pk__in=pks).update(is_visible=False, updated_at=now)
+            for model in cls.get_cascade_models():
+                model.visible_objects.filter(project__in=pks).update(is_visible=False, updated_at=now)
+            cls.notify_visibility_changed(pks, visible=False)
+        return count
+
+    @classmethod
+    def bulk_restore(cls, pks):
+        """
+        Show the hidden projects in `pks` again with the roles and comments
+        hidden together with them; those hidden before stay hidden.
+        Returns the number of projects restored.
+        """
+        with transaction.atomic():
+            hidden = defaultdict(list)
+            for pk, hidden_at in cls.non_visible_objects.filter(pk__in=pks).values_list('pk', 'updated_at'):
+                hidden[hidden_at].append(pk)
+
+            now = timezone.now()
+            count = cls.non_visible_objects.filter(pk__in=pks).update(is_visible=True, updated_at=now)
+            for model in cls.get_cascade_models():
+                # one UPDATE per table unless the projects were hidden at different times
+                for hidden_at, project_ids in hidden.items():
+                    model.non_visible_objects.filter(project__in=project_ids, updated_at=hidden_at).update(
+                        is_visible=True, updated_at=now
+                    )
+            cls.notify_visibility_changed([pk for project_ids in hidden.values() for pk in project_ids],
+                                          visible=True)
+        return count
+
+    @classmethod
+    def notify_visibility_changed(cls, pks, visible):
+        for model in [cls, *cls.get_cascade_models()]:
+            bump_generation(model)
+        project_visibility_changed.send(sender=cls, pks=pks, visible=visible)
+
 
 class ProjectRole(BaseModel):
     ROLE_CHOICES = [
@@ -126,6 +293,12 @@ class ProjectRole(BaseModel):
                                 blank=True, null=True)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, blank=True, null=True)
 
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            models.Index(fields=['project', '-created_at'], condition=models.Q(is_visible=True),
+                         name='api_prole_proj_vis_crt_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.project.name} - {self.role}"
 
@@ -137,7 +310,32 @@ class Comment(BaseModel):
                              related_name='comments', blank=True, null=True)
     text = models.TextField(blank=True, null=True)
 
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            models.Index(fields=['project', '-created_at'], condition=models.Q(is_visible=True),
+                         name='api_comment_proj_vis_crt_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.project.name}"
 
 
+class ProjectSummary(models.Model):
+    """
+    Counters of a project's visible comments and roles, maintained by
+    `api/summaries.py` in the same transaction as the writes.
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='summary')
+    comment_count = models.IntegerField(default=0)
+    owner_count = models.IntegerField(default=0)
+    editor_count = models.IntegerField(default=0)
+    reader_count = models.IntegerField(default=0)
+    last_activity_at = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def member_count(self):
+        return self.owner_count + self.editor_count + self.reader_count
+
+    def __str__(self):
+        return f"{self.project_id} summary"
@@ -1,4 +1,8 @@
-from rest_framework.pagination import PageNumberPagination
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 
 class CustomPagination(PageNumberPagination):
@@ -6,4 +10,62 @@ class CustomPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        `paginate_queryset` with the count and the page rows fetched through
+        the async ORM.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # `count` is a cached_property, so the page lookup below reuses it
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+        self.page.object_list = [row async for row in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class CustomCursorPagination(CursorPagination):
+    """
+    Cursor pagination ordered by `created_at` (default) or `updated_at`.
+
+    The cursor holds the value of the first ordering field of the last row
+    plus an offset among the rows sharing it, so pages are fetched with a
+    `WHERE created_at < <cursor>` seek instead of an OFFSET scan, and no
+    COUNT(*) is issued. Only the `cursor_ordering_fields` may be chosen
+    through `OrderingFilter`: a nullable first field has no position to seek
+    from, and text fields would be copied into the cursor. `id` is appended
+    as a tie-breaker so the ordering is always total.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    cursor_ordering_fields = ('created_at', 'updated_at', 'id', 'pk')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+
+        if any(field.lstrip('-') not in self.cursor_ordering_fields for field in ordering):
+            raise ParseError('Cursor pagination only supports ordering by created_at or updated_at.')
+
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            tie_breaker = '-id' if ordering[0].startswith('-') else 'id'
+            ordering.append(tie_breaker)
+        return tuple(ordering)
 
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # a single query whose position bookkeeping is done in
+        # paginate_queryset, run it in the request's thread
+        return await sync_to_async(self.paginate_queryset)(queryset, request, view)
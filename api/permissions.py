@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .authorization import get_project_role, OWNER, EDITOR
+
 
 class IsAdminUser(permissions.BasePermission):
     """
@@ -15,7 +17,7 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return obj.created_by == request.user
+        return obj.created_by_id == request.user.id
 
     
     def has_permission(self, request, view):
@@ -23,31 +25,55 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
 
 
 
-class IsProjectOwnerOrReadOnly(permissions.BasePermission):
+class ProjectRolePermission(permissions.BasePermission):
     """
-    Custom permission to allow only project owners to edit or delete.
+    Base permission granting writes to the object's author and to users
+    holding one of `write_roles` (`delete_roles` for DELETE) on its project.
+    Read permissions are allowed to any request.
     """
+    write_roles = (OWNER,)
+    delete_roles = (OWNER,)
+
+    def get_project_id(self, obj):
+        return obj.project_id
+
+    def is_author(self, request, obj):
+        return obj.user_id == request.user.id
+
     def has_object_permission(self, request, view, obj):
-        # Read permissions are allowed to any request
         if request.method in permissions.SAFE_METHODS:
             return True
-        # Write permissions are only allowed to the owner of the project
-        return obj.created_by == request.user
+        if self.is_author(request, obj):
+            return True
 
-class IsProjectRoleOwnerOrReadOnly(permissions.BasePermission):
+        project_id = self.get_project_id(obj)
+        if project_id is None:
+            return False
+        roles = self.delete_roles if request.method == 'DELETE' else self.write_roles
+        return get_project_role(request, project_id) in roles
+
+
+class IsProjectOwnerOrReadOnly(ProjectRolePermission):
     """
-    Custom permission to allow only project role owners to edit or delete.
+    Custom permission to allow only project owners to delete and owners or
+    editors to edit.
     """
-    def has_object_permission(self, request, view, obj):
-        if request.method in permissions.SAFE_METHODS:
-            return True
-        return obj.user == request.user
+    write_roles = (OWNER, EDITOR)
+
+    def get_project_id(self, obj):
+        return obj.pk
+
+    def is_author(self, request, obj):
+        return obj.created_by_id == request.user.id
 
-class IsCommentOwnerOrReadOnly(permissions.BasePermission):
+class IsProjectRoleOwnerOrReadOnly(ProjectRolePermission):
     """
-    Custom permission to allow only comment owners to edit or delete.
+    Custom permission to allow only project role owners and project owners
+    to edit or delete.
+    """
+
+class IsCommentOwnerOrReadOnly(ProjectRolePermission):
+    """
+    Custom permission to allow only comment owners and project owners to
+    edit or delete.
     """
-    def has_object_permission(self, request, view, obj):
-        if request.method in permissions.SAFE_METHODS:
-            return True
-        return obj.user == request.user
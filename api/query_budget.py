@@ -0,0 +1,187 @@
+"""
+Query budgets: the maximum number of SQL statements a view may issue per
+request, and detection of N+1 loads.
+
+Views declare their budget with a `query_budget` attribute, an int or a
+`{method: int}` dict, or with the `query_budget` decorator on function views.
+`QueryBudgetMiddleware` counts the statements of each request and reports
+
+- requests issuing more statements than the view's budget, and
+- statements repeated with the same shape (the SQL without its parameters),
+  the signature of a relation loaded once per row. Repeats triggered by a
+  serializer field are reported from the second statement on, naming the
+  field; other shapes from `repeat_threshold` statements on, as a few reads
+  of the same row (e.g. before and after a write) are expected.
+
+`settings.API_QUERY_BUDGET` selects what happens: `raise` fails the request
+with `QueryBudgetExceeded` (the default under `manage.py test`), `log` writes
+a warning (development) and `off` skips the tracking (production).
+Streamed response bodies run after the middleware and are not counted.
+"""
+import contextvars
+import logging
+import re
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.decorators import sync_and_async_middleware
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from rest_framework.serializers import Serializer
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_LIST_RE = re.compile(r'%s(?:\s*,\s*%s)+')
+# statements the ORM repeats by design
+IGNORED_SHAPE_RE = re.compile(r'^\s*(?:SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.IGNORECASE)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(budget):
+    """
+    Declare the budget of a function view or a view class.
+    """
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def get_query_shape(sql):
+    return PLACEHOLDER_LIST_RE.sub('%s, ...', sql)
+
+
+def find_serializer_field():
+    """
+    Return `Serializer.field` for the innermost serializer field being read
+    on the current stack, or `None`.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code is Serializer.to_representation.__code__ and 'field' in frame.f_locals:
+            field = frame.f_locals['field']
+            return f'{type(field.parent).__name__}.{field.field_name}'
+        frame = frame.f_back
+    return None
+
+
+class QueryTracker:
+    """
+    The statements of one request, by shape.
+    """
+    repeat_threshold = 3
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+        self.sources = {}
+
+    def record(self, sql):
+        self.count += 1
+        shape = get_query_shape(sql)
+        if IGNORED_SHAPE_RE.match(shape):
+            return
+        self.shapes[shape] += 1
+        if self.shapes[shape] == 2:
+            # walking the stack is only worth it once a shape repeats
+            self.sources[shape] = find_serializer_field()
+
+    def get_repeated(self):
+        """
+        Return `[(shape, count, serializer field or None)]` for the shapes
+        repeated often enough to report.
+        """
+        return [
+            (shape, count, self.sources.get(shape)) for shape, count in self.shapes.items()
+            if count >= self.repeat_threshold or (count > 1 and self.sources.get(shape))
+        ]
+
+
+_current = contextvars.ContextVar('query_tracker', default=None)
+
+
+def track_query(execute, sql, params, many, context):
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.record(sql)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_tracker(sender, connection, **kwargs):
+    if track_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_query)
+
+
+def get_view_budget(view_func, method):
+    view_class = getattr(view_func, 'view_class', None)
+    budget = getattr(view_class, 'query_budget', None) if view_class else None
+    if budget is None:
+        budget = getattr(view_func, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+@sync_and_async_middleware
+class QueryBudgetMiddleware:
+    """
+    Check the views' query budgets; see the module docstring.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if settings.API_QUERY_BUDGET == 'off':
+            return self.get_response(request)
+        tracker = QueryTracker()
+        token = _current.set(tracker)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.check(request, tracker)
+        return response
+
+    async def __acall__(self, request):
+        if settings.API_QUERY_BUDGET == 'off':
+            return await self.get_response(request)
+        tracker = QueryTracker()
+        token = _current.set(tracker)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.check(request, tracker)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_view_budget(view_func, request.method)
+
+    def check(self, request, tracker):
+        problems = []
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and tracker.count > budget:
+            problems.append(f'{tracker.count} queries, budget {budget}')
+        for shape, count, field in tracker.get_repeated():
+            source = f' loaded by {field}' if field else ''
+            problems.append(f'{count}x{source}: {shape}')
+        if not problems:
+            return
+
+        message = f'{request.method} {request.path}: ' + '; '.join(problems)
+        if settings.API_QUERY_BUDGET == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
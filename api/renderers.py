@@ -0,0 +1,10 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class EventStreamRenderer(JSONRenderer):
+    """
+    Lets `text/event-stream` requests pass content negotiation. Event streams
+    are written by the view itself; error responses are rendered as JSON.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
@@ -0,0 +1,146 @@
+"""
+The OpenAPI schema served from a prebuilt artifact.
+
+drf-spectacular introspects every view and serializer to build the schema,
+so `python manage.py build_schema` does it once and writes the JSON to
+`settings.API_SCHEMA_FILE`, committed with the code. `schema_view` serves it
+as YAML (the default, as `SpectacularAPIView` does) or JSON, gzipped when
+the client accepts it, with a strong ETag per representation. The
+representations are built once per process; without an artifact the schema
+is generated on first use instead.
+
+`build_schema --check`, the test suite and `check --deploy` report an
+artifact that no longer matches the code.
+"""
+import gzip
+import hashlib
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.checks import Warning, register
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from drf_spectacular.drainage import GENERATOR_STATS
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+from .query_budget import query_budget
+
+SchemaDocument = namedtuple('SchemaDocument', ['content', 'gzipped', 'etag', 'gzipped_etag', 'content_type'])
+
+# seconds clients reuse the schema before revalidating it with the ETag
+SCHEMA_MAX_AGE = 60
+
+
+class StatelessJWTScheme(SimpleJWTScheme):
+    """
+    The bearer JWT scheme of simplejwt for `StatelessJWTAuthentication`,
+    which drf-spectacular only matches by exact class.
+    """
+    target_class = 'api.authentication.StatelessJWTAuthentication'
+    name = 'jwtAuth'
+
+
+def generate_schema():
+    """
+    Generate the schema from the code and return it rendered as JSON.
+    """
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    return OpenApiJsonRenderer().render(schema, renderer_context={})
+
+
+def read_schema_file():
+    """
+    Return the content of the artifact, or `None` when it was not built.
+    """
+    try:
+        with open(settings.API_SCHEMA_FILE, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_schema_file(content):
+    with open(settings.API_SCHEMA_FILE, 'wb') as f:
+        f.write(content)
+
+
+def make_document(content, media_type):
+    digest = hashlib.sha256(content).hexdigest()
+    # mtime=0 keeps the compressed bytes, and so their ETag, stable
+    return SchemaDocument(content, gzip.compress(content, mtime=0), quote_etag(digest),
+                          quote_etag(f'{digest}-gzip'), f'{media_type}; charset=utf-8')
+
+
+_documents = None
+
+
+def get_schema_documents():
+    """
+    Return `{format: SchemaDocument}` for the `json` and `yaml` formats.
+    """
+    global _documents
+    if _documents is None:
+        content = read_schema_file() or generate_schema()
+        yaml = OpenApiYamlRenderer().render(json.loads(content), renderer_context={})
+        _documents = {
+            'json': make_document(content, OpenApiJsonRenderer.media_type),
+            'yaml': make_document(yaml, OpenApiYamlRenderer.media_type),
+        }
+    return _documents
+
+
+def clear_schema_documents():
+    global _documents
+    _documents = None
+
+
+def get_format(request):
+    schema_format = request.GET.get('format')
+    if schema_format in ('json', 'yaml'):
+        return schema_format
+    return 'json' if 'json' in request.headers.get('Accept', '') else 'yaml'
+
+
+@query_budget(0)
+@require_safe
+def schema_view(request):
+    """
+    The prebuilt OpenAPI schema; see the module docstring.
+    """
+    document = get_schema_documents()[get_format(request)]
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        content, etag = document.gzipped, document.gzipped_etag
+    else:
+        content, etag = document.content, document.etag
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type=document.content_type)
+        if content is document.gzipped:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=SCHEMA_MAX_AGE)
+    patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+    return response
+
+
+@register('api', deploy=True)
+def check_schema_file(app_configs, **kwargs):
+    content = read_schema_file()
+    if content is None:
+        return [Warning('The OpenAPI schema artifact is missing; it will be generated by every process.',
+                        hint='Run `python manage.py build_schema`.', id='api.W001')]
+    # the warnings of the generator are build_schema's business
+    with GENERATOR_STATS.silence():
+        generated = generate_schema()
+    if content != generated:
+        return [Warning('The OpenAPI schema artifact does not match the code.',
+                        hint='Run `python manage.py build_schema`.', id='api.W002')]
+    return []
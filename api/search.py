@@ -0,0 +1,269 @@
+"""
+Full-text search backed by a per-model search table.
+
+Every registered model gets a `<db_table>_search` table holding one document
+per visible row, built from the index `fields` (own and related columns).
+On SQLite the documents are indexed by an external-content FTS5 table, on
+PostgreSQL they are stored as a `tsvector` with a GIN index. `?search=`
+becomes an index lookup with prefix matching on every term and the results
+are ordered by relevance; on other databases `FullTextSearchFilter` falls
+back to DRF's `icontains` search.
+
+The tables are created by migration `0005_search_tables`. Documents are kept
+up to date from signals (see `api/signals.py`) and can be rebuilt with the
+`rebuild_search_index` management command.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+
+from rest_framework.filters import SearchFilter
+
+from .models import Project, ProjectRole, Comment
+
+# unicode61 (FTS5) splits on everything but letters and digits, so documents
+# and queries are tokenized the same way on every backend
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    The document definition of one model: the `fields` whose text is indexed,
+    following relations with `__` like `search_fields` does.
+    """
+    batch_size = 1000
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+
+    @cached_property
+    def table(self):
+        return f'{self.model._meta.db_table}_search'
+
+    @cached_property
+    def dependencies(self):
+        """
+        `{model: (lookup, attnames)}`: the models whose columns end up in the
+        documents, with the lookup from the indexed model to them and the
+        columns read. Changing one of those columns changes the documents of
+        the rows matching `{lookup: pk}`.
+        """
+        dependencies = {self.model: ('pk', {'is_visible'})}
+        for path in self.fields:
+            model, lookup = self.model, 'pk'
+            for name in path.split('__'):
+                field = model._meta.get_field(name)
+                dependencies.setdefault(model, (lookup, set()))[1].add(field.attname)
+                if field.is_relation:
+                    model = field.related_model
+                    lookup = name if lookup == 'pk' else f'{lookup}__{name}'
+        return {model: (lookup, frozenset(attnames)) for model, (lookup, attnames) in dependencies.items()}
+
+    def iter_documents(self, queryset):
+        rows = queryset.filter(is_visible=True).values_list('pk', *self.fields).iterator(chunk_size=self.batch_size)
+        for pk, *values in rows:
+            yield pk, ' '.join(token for value in values if value is not None for token in tokenize(str(value)))
+
+    def update(self, queryset, using='default'):
+        """
+        Rebuild the documents of the rows in `queryset`; rows that are no
+        longer visible are removed from the index.
+        """
+        backend = get_backend(connections[using])
+        if backend is None:
+            return
+        pks = list(queryset.using(using).values_list('pk', flat=True))
+        for start in range(0, len(pks), self.batch_size):
+            chunk = pks[start:start + self.batch_size]
+            documents = list(self.iter_documents(self.model._default_manager.using(using).filter(pk__in=chunk)))
+            backend.delete(self, chunk, using)
+            backend.insert(self, documents, using)
+
+    def delete(self, pks, using='default'):
+        backend = get_backend(connections[using])
+        if backend is not None:
+            backend.delete(self, list(pks), using)
+
+    def delete_matching(self, queryset, using='default'):
+        """
+        Remove the documents of the rows in `queryset` with one statement.
+        """
+        connection = connections[using]
+        if get_backend(connection) is None:
+            return
+        sql, params = queryset.values('pk').query.get_compiler(using).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{self.table}" WHERE object_id IN ({sql})', params)
+
+    def rebuild(self, using='default'):
+        backend = get_backend(connections[using])
+        if backend is None:
+            return
+        backend.clear(self, using)
+        queryset = self.model._default_manager.using(using).all()
+        batch = []
+        for document in self.iter_documents(queryset):
+            batch.append(document)
+            if len(batch) == self.batch_size:
+                backend.insert(self, batch, using)
+                batch = []
+        backend.insert(self, batch, using)
+
+    def db_pk(self, pk, using='default'):
+        return self.model._meta.pk.get_db_prep_value(pk, connections[using])
+
+
+class SQLiteBackend:
+    """
+    `<table>` stores `(object_id, document)`, `<table>_fts` is an
+    external-content FTS5 index over it kept in sync by triggers.
+    """
+
+    def insert(self, index, documents, using):
+        if documents:
+            with connections[using].cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO "{index.table}" (object_id, document) VALUES (%s, %s)',
+                    [(index.db_pk(pk, using), document) for pk, document in documents]
+                )
+
+    def delete(self, index, pks, using):
+        if pks:
+            with connections[using].cursor() as cursor:
+                placeholders = ', '.join(['%s'] * len(pks))
+                cursor.execute(f'DELETE FROM "{index.table}" WHERE object_id IN ({placeholders})',
+                               [index.db_pk(pk, using) for pk in pks])
+
+    def clear(self, index, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{index.table}"')
+
+    def build_query(self, tokens):
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def filter(self, queryset, index, tokens):
+        query, table = self.build_query(tokens), index.table
+        pk_column = f'"{queryset.model._meta.db_table}"."{queryset.model._meta.pk.column}"'
+        matches = RawSQL(
+            f'SELECT s.object_id FROM "{table}" s JOIN "{table}_fts" ON "{table}_fts".rowid = s.id '
+            f'WHERE "{table}_fts" MATCH %s', (query,)
+        )
+        # bm25 is lower for better matches; the rank is looked up by rowid
+        rank = RawSQL(
+            f'SELECT -bm25("{table}_fts") FROM "{table}_fts" WHERE "{table}_fts" MATCH %s '
+            f'AND rowid = (SELECT s.id FROM "{table}" s WHERE s.object_id = {pk_column})', (query,),
+            output_field=FloatField()
+        )
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+
+class PostgreSQLBackend:
+    """
+    `<table>` stores `(object_id, document tsvector)` with a GIN index; rows
+    are removed with their object by the foreign key.
+    """
+
+    def insert(self, index, documents, using):
+        if documents:
+            with connections[using].cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO "{index.table}" (object_id, document) '
+                    f'VALUES (%s, to_tsvector(\'simple\', %s))',
+                    [(index.db_pk(pk, using), document) for pk, document in documents]
+                )
+
+    def delete(self, index, pks, using):
+        if pks:
+            with connections[using].cursor() as cursor:
+                cursor.execute(f'DELETE FROM "{index.table}" WHERE object_id = ANY(%s)',
+                               [[index.db_pk(pk, using) for pk in pks]])
+
+    def clear(self, index, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'TRUNCATE "{index.table}"')
+
+    def build_query(self, tokens):
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def filter(self, queryset, index, tokens):
+        query, table = self.build_query(tokens), index.table
+        pk_column = f'"{queryset.model._meta.db_table}"."{queryset.model._meta.pk.column}"'
+        matches = RawSQL(
+            f'SELECT object_id FROM "{table}" WHERE document @@ to_tsquery(\'simple\', %s)', (query,)
+        )
+        rank = RawSQL(
+            f'SELECT ts_rank(document, to_tsquery(\'simple\', %s)) FROM "{table}" WHERE object_id = {pk_column}',
+            (query,), output_field=FloatField()
+        )
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend(),
+    'postgresql': PostgreSQLBackend(),
+}
+
+
+def get_backend(connection):
+    return BACKENDS.get(connection.vendor)
+
+
+_indexes = {}
+
+
+def register(model, fields):
+    _indexes[model] = SearchIndex(model, fields)
+    return _indexes[model]
+
+
+def get_search_index(model):
+    return _indexes.get(model)
+
+
+def get_search_indexes():
+    return list(_indexes.values())
+
+
+def get_search_dependents(model):
+    """
+    Return `(index, lookup, attnames)` for every index whose documents read
+    columns of `model`.
+    """
+    return [(index, *index.dependencies[model]) for index in _indexes.values() if model in index.dependencies]
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    `SearchFilter` answered from the model's search index. All terms must
+    match (as prefixes) and results are ordered by relevance, then by the
+    view's ordering. Models without an index, or databases without a search
+    backend, use the regular `icontains` search.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        index = get_search_index(queryset.model)
+        backend = get_backend(connections[queryset.db])
+        if index is None or backend is None:
+            return super().filter_queryset(request, queryset, view)
+
+        tokens = [token for term in self.get_search_terms(request) for token in tokenize(term)]
+        if not tokens:
+            return queryset
+        queryset = backend.filter(queryset, index, tokens)
+        return queryset.order_by('-search_rank', *queryset.query.order_by)
+
+
+register(Project, ['name', 'description', 'created_by__first_name', 'created_by__last_name',
+                   'created_by__email'])
+register(ProjectRole, ['user__first_name', 'user__last_name', 'user__email', 'project__name',
+                       'project__description', 'role'])
+register(Comment, ['project__name', 'project__description', 'user__first_name', 'user__last_name',
+                   'user__email', 'text'])
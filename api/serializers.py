@@ -1,19 +1,74 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
 from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
 
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
 
 UserModel = get_user_model()
 
+from .authentication import is_token_revoked
+from .authorization import get_project_role, OWNER
+from .tokens import CustomRefreshToken
 from .models import (
     Project,
     ProjectRole,
     Comment,
+    ProjectSummary,
 )
 
 
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that resolves pks from
+    `context['related_objects'][field_name]` when the view prefetched them,
+    instead of issuing one query per value.
+    """
+    def to_internal_value(self, data):
+        related_objects = self.context.get('related_objects', {}).get(self.field_name)
+        if related_objects is None or self.pk_field is not None:
+            return super().to_internal_value(data)
+
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return related_objects[pk]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class FieldSelectionMixin:
+    """
+    Serializer rendering only the `fields` given, with the nested relations
+    not listed in `expand` rendered as primary keys. Both default to
+    everything.
+    """
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selected_fields = fields
+        self.expanded_fields = expand
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.selected_fields is not None:
+            fields = {name: field for name, field in fields.items() if name in self.selected_fields}
+        if self.expanded_fields is not None:
+            for name, field in fields.items():
+                if isinstance(field, serializers.BaseSerializer) and name not in self.expanded_fields:
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+        return fields
+
+
 class UserInfoSerialzer(serializers.ModelSerializer):
     class Meta:
         model = UserModel
@@ -21,15 +76,53 @@ class UserInfoSerialzer(serializers.ModelSerializer):
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
-    
+    token_class = CustomRefreshToken
+
     def validate(self, attrs):
-        data = super().validate(attrs)
+        # authenticate only; the tokens are built here so the user info is
+        # serialized once, for the token claim and the response alike
+        data = super(TokenObtainPairSerializer, self).validate(attrs)
 
         if not self.user.is_visible:
             raise ValidationError("No active account found with the given credentials")
 
-        user_info = UserInfoSerialzer(self.user).data
-        
+        refresh = self.get_token(self.user)
+        data['refresh'] = str(refresh)
+        data['access'] = str(refresh.access_token)
+        data['user_info'] = refresh['user_info']
+
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        return data
+
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Adds the `user_info` claim of the token to the response: the user as of
+    the login, not reloaded on refresh. Tokens issued before the claim
+    existed load the user instead. Refresh tokens revoked since (see
+    `revoke_user_tokens`) are rejected.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh[jwt_settings.USER_ID_CLAIM]
+        if settings.API_CACHE_SHARED:
+            revoked = is_token_revoked(user_id, refresh)
+        else:
+            # the denylist of this process may miss revocations
+            revoked = not UserModel.objects.filter(pk=user_id, is_active=True, is_visible=True).exists()
+        if revoked:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+
+        data = super().validate(attrs)
+
+        token = AccessToken(data['access'])
+        user_info = token.get('user_info')
+        if user_info is None:
+            user = UserModel.objects.get(pk=token['user_id'])
+            user_info = UserInfoSerialzer(user).data
+
         data['user_info'] = user_info
         return data
 
@@ -81,7 +174,7 @@ class CreateUserSerializer(serializers.ModelSerializer):
 
 
 
-class ProjectListSerializer(serializers.ModelSerializer):
+class ProjectListSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     created_by = UserInfoSerialzer(read_only=True)
 
     class Meta:
@@ -90,6 +183,16 @@ class ProjectListSerializer(serializers.ModelSerializer):
 
 
 
+class ProjectCompactSerializer(serializers.ModelSerializer):
+    """
+    Project with `created_by` as a user id, used in compact representations.
+    """
+    class Meta:
+        model = Project
+        fields = '__all__'
+
+
+
 class ProjectCreateOrUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
@@ -97,7 +200,27 @@ class ProjectCreateOrUpdateSerializer(serializers.ModelSerializer):
 
 
 
-class ProjectRoleListSerializer(serializers.ModelSerializer):
+class ProjectSummarySerializer(serializers.ModelSerializer):
+    """
+    Counters of a project, read from its `ProjectSummary` row.
+    """
+    member_count = serializers.IntegerField(read_only=True)
+    members_by_role = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProjectSummary
+        fields = ['project', 'comment_count', 'member_count', 'members_by_role', 'last_activity_at']
+
+    def get_members_by_role(self, obj) -> dict:
+        return {
+            'OWNER': obj.owner_count,
+            'EDITOR': obj.editor_count,
+            'READER': obj.reader_count,
+        }
+
+
+
+class ProjectRoleListSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     user = UserInfoSerialzer(read_only=True)
     project = ProjectListSerializer(read_only=True)
 
@@ -106,15 +229,46 @@ class ProjectRoleListSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ProjectRoleCompactSerializer(serializers.ModelSerializer):
+    """
+    ProjectRole with `user` and `project` as ids, used in compact representations.
+    """
+    class Meta:
+        model = ProjectRole
+        fields = '__all__'
+
+
 class ProjectRoleCreateOrUpdateSerializer(serializers.ModelSerializer):
+    """
+    Roles are granted or changed by the owners of the project only, and a
+    role can not be moved to another project.
+    """
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
 
     class Meta:
         model = ProjectRole
         fields = ['project', 'role']
 
+    def validate(self, attrs):
+        project = attrs.get('project')
+        if self.instance is not None:
+            if project is not None and project.pk != self.instance.project_id:
+                raise ValidationError({'project': 'The project of a role can not be changed.'})
+            if attrs.get('role', self.instance.role) == self.instance.role:
+                return attrs
+            project_id = self.instance.project_id
+        elif project is None:
+            raise ValidationError({'project': 'This field is required.'})
+        else:
+            project_id = project.pk
+
+        if get_project_role(self.context['request'], project_id) != OWNER:
+            raise ValidationError({'role': 'Only the owners of the project can grant or change roles.'})
+        return attrs
+
 
 
-class CommentListSerializer(serializers.ModelSerializer):
+class CommentListSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     user = UserInfoSerialzer(read_only=True)
     project = ProjectListSerializer(read_only=True)
 
@@ -124,7 +278,19 @@ class CommentListSerializer(serializers.ModelSerializer):
 
 
 
+class CommentCompactSerializer(serializers.ModelSerializer):
+    """
+    Comment with `user` and `project` as ids, used in compact representations.
+    """
+    class Meta:
+        model = Comment
+        fields = '__all__'
+
+
+
 class CommentCreateOrUpdateSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = Comment
         fields = ['project', 'text']
@@ -0,0 +1,223 @@
+from django.contrib.auth import get_user_model
+from django.db.models import DEFERRED, F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import revoke_user_tokens
+from .authorization import invalidate_project_roles
+from .events import publish_changes, publish_deletion, publish_deletions
+from .models import Project, ProjectRole, Comment, ProjectSummary, project_visibility_changed, rows_changed
+from .search import get_search_dependents, get_search_index
+from .summaries import DeltaCollector, apply_deltas, recompute_summaries
+
+UserModel = get_user_model()
+
+
+def loaded_value(instance, attname):
+    """
+    Value of `attname` when `instance` was loaded from the database, or the
+    current value for new instances.
+    """
+    value = getattr(instance, '_loaded_values', {}).get(attname, DEFERRED)
+    if value is DEFERRED:
+        return getattr(instance, attname)
+    return value
+
+
+@receiver(post_save, sender=ProjectRole)
+@receiver(post_delete, sender=ProjectRole)
+def invalidate_project_role_cache(sender, instance, **kwargs):
+    invalidate_project_roles({
+        (instance.user_id, instance.project_id),
+        (loaded_value(instance, 'user_id'), loaded_value(instance, 'project_id')),
+    })
+
+
+@receiver(rows_changed, sender=ProjectRole)
+def invalidate_bulk_project_role_cache(sender, pks, instances=None, **kwargs):
+    pairs = set(ProjectRole.objects.filter(pk__in=pks).values_list('user_id', 'project_id'))
+    for instance in instances or ():
+        pairs.add((loaded_value(instance, 'user_id'), loaded_value(instance, 'project_id')))
+    invalidate_project_roles(pairs)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_project_owner_cache(sender, instance, **kwargs):
+    invalidate_project_roles({
+        (instance.created_by_id, instance.pk),
+        (loaded_value(instance, 'created_by_id'), instance.pk),
+    })
+
+
+@receiver(project_visibility_changed, sender=Project)
+def invalidate_cascaded_project_role_cache(sender, pks, **kwargs):
+    pairs = set(ProjectRole.objects.filter(project__in=pks).values_list('user_id', 'project_id'))
+    pairs.update(Project.objects.filter(pk__in=pks).values_list('created_by_id', 'pk'))
+    invalidate_project_roles(pairs)
+
+
+@receiver(post_save, sender=UserModel)
+def revoke_tokens_of_changed_user(sender, instance, **kwargs):
+    # stateless tokens can not see the row, so deactivation goes through the
+    # denylist, and so does a new user_type: tokens carry it as a claim
+    if (not instance.is_active or not instance.is_visible
+            or loaded_value(instance, 'user_type') != instance.user_type):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=UserModel)
+def revoke_tokens_of_deleted_user(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+
+
+def search_fields_changed(instance, attnames, update_fields=None):
+    if update_fields is not None:
+        names = set(attnames) | {attname[:-3] for attname in attnames if attname.endswith('_id')}
+        return not names.isdisjoint(update_fields)
+    if not hasattr(instance, '_loaded_values'):
+        return True
+    return any(loaded_value(instance, attname) != getattr(instance, attname) for attname in attnames)
+
+
+# the models read by the search documents (see SearchIndex.dependencies)
+@receiver(post_save, sender=UserModel)
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=ProjectRole)
+@receiver(post_save, sender=Comment)
+def update_search_documents(sender, instance, created, update_fields=None, using='default', **kwargs):
+    for index, lookup, attnames in get_search_dependents(sender):
+        if created and lookup != 'pk':
+            # nothing references a new row yet
+            continue
+        if created or search_fields_changed(instance, attnames, update_fields):
+            index.update(index.model._default_manager.filter(**{lookup: instance.pk}), using=using)
+
+
+@receiver(rows_changed, sender=Project)
+@receiver(rows_changed, sender=ProjectRole)
+@receiver(rows_changed, sender=Comment)
+def update_bulk_search_documents(sender, pks, created=False, **kwargs):
+    for index, lookup, attnames in get_search_dependents(sender):
+        if not created or lookup == 'pk':
+            index.update(index.model._default_manager.filter(**{f'{lookup}__in': pks}))
+
+
+@receiver(project_visibility_changed, sender=Project)
+def update_cascaded_search_documents(sender, pks, visible, **kwargs):
+    for model in [sender, *sender.get_cascade_models()]:
+        index = get_search_index(model)
+        if index is None:
+            continue
+        lookup = 'pk' if model is sender else 'project'
+        queryset = model._default_manager.filter(**{f'{lookup}__in': pks})
+        if visible:
+            index.update(queryset)
+        else:
+            # hidden rows have no document, no need to read them
+            index.delete_matching(queryset)
+
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=ProjectRole)
+@receiver(post_delete, sender=Comment)
+def delete_search_document(sender, instance, using='default', **kwargs):
+    index = get_search_index(sender)
+    if index is not None:
+        index.delete([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=ProjectRole)
+def publish_saved_row(sender, instance, created, using='default', **kwargs):
+    publish_changes(sender, [instance.pk], created=created, using=using)
+
+
+@receiver(rows_changed, sender=Comment)
+@receiver(rows_changed, sender=ProjectRole)
+def publish_changed_rows(sender, pks, created=False, **kwargs):
+    publish_changes(sender, pks, created=created)
+
+
+@receiver(project_visibility_changed, sender=Project)
+def publish_cascaded_rows(sender, pks, visible, **kwargs):
+    # the rows hidden or restored with their project share its updated_at
+    for model in sender.get_cascade_models():
+        changed = model._default_manager.filter(project__in=pks, is_visible=visible,
+                                                updated_at=F('project__updated_at'))
+        if visible:
+            publish_changes(model, changed.values_list('pk', flat=True))
+        else:
+            publish_deletions(model, changed.values_list('pk', 'project_id'))
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=ProjectRole)
+def publish_deleted_row(sender, instance, using='default', **kwargs):
+    if instance.project_id is not None:
+        publish_deletion(sender, instance.pk, instance.project_id, using=using)
+
+
+def summary_state(sender, instance, loaded=False):
+    value = (lambda attname: loaded_value(instance, attname)) if loaded else (lambda attname: getattr(instance, attname))
+    return value('project_id'), value('role') if sender is ProjectRole else None, bool(value('is_visible'))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=ProjectRole)
+def count_saved_row(sender, instance, created, using='default', **kwargs):
+    if not created and not hasattr(instance, '_loaded_values'):
+        # the previous state is unknown
+        recompute_summaries([instance.project_id], using=using)
+        return
+    collector = DeltaCollector()
+    old = None if created else summary_state(sender, instance, loaded=True)
+    collector.transition(sender, old, summary_state(sender, instance))
+    apply_deltas(collector.deltas, using=using)
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=ProjectRole)
+def count_deleted_row(sender, instance, using='default', **kwargs):
+    collector = DeltaCollector()
+    collector.transition(sender, summary_state(sender, instance, loaded=True), None)
+    # when the project itself is being deleted its summary is already gone
+    apply_deltas(collector.deltas, using=using, recompute_missing=False)
+
+
+@receiver(rows_changed, sender=Comment)
+@receiver(rows_changed, sender=ProjectRole)
+def count_changed_rows(sender, pks, instances=None, created=False, **kwargs):
+    if created and instances is not None:
+        # new rows have no previous state to read back
+        collector = DeltaCollector()
+        for instance in instances:
+            collector.transition(sender, None, summary_state(sender, instance))
+        apply_deltas(collector.deltas)
+        return
+    project_ids = set(sender.objects.filter(pk__in=pks).values_list('project_id', flat=True))
+    project_ids.update(loaded_value(instance, 'project_id') for instance in instances or ())
+    recompute_summaries(project_ids)
+
+
+@receiver(project_visibility_changed, sender=Project)
+def count_cascaded_rows(sender, pks, visible, **kwargs):
+    # summaries of hidden projects are not served, they catch up on restore
+    if visible:
+        recompute_summaries(pks)
+
+
+@receiver(post_save, sender=Project)
+def create_project_summary(sender, instance, created, using='default', **kwargs):
+    if created:
+        ProjectSummary.objects.using(using).create(project=instance, last_activity_at=instance.created_at)
+    else:
+        apply_deltas({instance.pk: {}}, using=using)
+
+
+@receiver(rows_changed, sender=Project)
+def create_project_summaries(sender, pks, created=False, **kwargs):
+    if created:
+        recompute_summaries(pks)
+    else:
+        apply_deltas({pk: {} for pk in pks})
@@ -0,0 +1,122 @@
+"""
+Maintenance of the `ProjectSummary` counters.
+
+Single-row writes are applied as deltas (`UPDATE ... SET comment_count =
+comment_count + 1`) from the signal receivers in `api/signals.py`; set-based
+writes and anything whose previous state is unknown recompute the affected
+projects from their rows. Both run in the transaction of the write.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from .models import Project, ProjectRole, Comment, ProjectSummary
+
+ROLE_COUNT_FIELDS = {
+    'OWNER': 'owner_count',
+    'EDITOR': 'editor_count',
+    'READER': 'reader_count',
+}
+
+
+def get_counter_field(model, role=None):
+    """
+    Return the summary field counting a visible `model` row, or `None`.
+    """
+    if model is Comment:
+        return 'comment_count'
+    if model is ProjectRole:
+        return ROLE_COUNT_FIELDS.get(role)
+    return None
+
+
+def apply_deltas(deltas, using='default', recompute_missing=True):
+    """
+    Apply `{project_id: {field: delta}}` and record the activity. Projects
+    without a summary row yet are recomputed instead, unless
+    `recompute_missing` is false.
+    """
+    now = timezone.now()
+    missing = []
+    for project_id, counts in deltas.items():
+        if project_id is None:
+            continue
+        updates = {field: F(field) + delta for field, delta in counts.items() if field and delta}
+        updated = (ProjectSummary.objects.using(using)
+                   .filter(project_id=project_id)
+                   .update(last_activity_at=now, **updates))
+        if not updated:
+            missing.append(project_id)
+    if missing and recompute_missing:
+        recompute_summaries(missing, using=using)
+
+
+def recompute_summaries(project_ids, using='default'):
+    """
+    Rebuild the summaries of `project_ids` from their rows.
+    """
+    project_ids = {project_id for project_id in project_ids if project_id is not None}
+    if not project_ids:
+        return
+
+    summaries = {
+        pk: ProjectSummary(project_id=pk, last_activity_at=updated_at)
+        for pk, updated_at in Project.objects.using(using).filter(pk__in=project_ids).values_list('pk', 'updated_at')
+    }
+
+    def record_activity(project_id, last_activity_at):
+        summary = summaries.get(project_id)
+        if summary is not None and last_activity_at is not None:
+            summary.last_activity_at = max(filter(None, [summary.last_activity_at, last_activity_at]))
+
+    comments = (Comment.objects.using(using).filter(project_id__in=summaries)
+                .values('project_id')
+                .annotate(count=Count('pk', filter=Q(is_visible=True)), last_activity_at=Max('updated_at'))
+                .values_list('project_id', 'count', 'last_activity_at'))
+    for project_id, count, last_activity_at in comments:
+        summaries[project_id].comment_count = count
+        record_activity(project_id, last_activity_at)
+
+    roles = (ProjectRole.objects.using(using).filter(project_id__in=summaries)
+             .values('project_id', 'role')
+             .annotate(count=Count('pk', filter=Q(is_visible=True)), last_activity_at=Max('updated_at'))
+             .values_list('project_id', 'role', 'count', 'last_activity_at'))
+    for project_id, role, count, last_activity_at in roles:
+        field = get_counter_field(ProjectRole, role)
+        if field is not None:
+            setattr(summaries[project_id], field, count)
+        record_activity(project_id, last_activity_at)
+
+    ProjectSummary.objects.using(using).bulk_create(
+        summaries.values(),
+        update_conflicts=True,
+        unique_fields=['project'],
+        update_fields=['comment_count', 'owner_count', 'editor_count', 'reader_count', 'last_activity_at'],
+    )
+
+
+class DeltaCollector:
+    """
+    Accumulates `{project_id: {field: delta}}` from row transitions.
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: defaultdict(int))
+
+    def add(self, project_id, field, delta):
+        # an activity-only entry is recorded with a `None` field
+        self.deltas[project_id][field] += delta
+
+    def transition(self, model, old, new):
+        """
+        Record a row moving from `old` to `new`, each `(project_id, role,
+        is_visible)` or `None` when the row does not exist.
+        """
+        if old is not None and old[2]:
+            self.add(old[0], get_counter_field(model, old[1]), -1)
+        if new is not None and new[2]:
+            self.add(new[0], get_counter_field(model, new[1]), 1)
+        for state in (old, new):
+            if state is not None:
+                self.add(state[0], None, 0)
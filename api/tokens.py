@@ -0,0 +1,20 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class CustomRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user claims `StatelessJWTAuthentication` needs,
+    so access tokens derived from it authenticate without a user lookup, and
+    the `user_info` profile returned on login and refresh.
+    """
+    user_claims = ('email', 'user_type', 'is_visible')
+
+    @classmethod
+    def for_user(cls, user):
+        from .serializers import UserInfoSerialzer
+
+        token = super().for_user(user)
+        for claim in cls.user_claims:
+            token[claim] = getattr(user, claim)
+        token['user_info'] = UserInfoSerialzer(user).data
+        return token
@@ -4,18 +4,25 @@ from . import views
 
 urlpatterns = [
     path('token/', views.CustomTokenObtainPairView.as_view()),
+    path('token/refresh/', views.CustomTokenRefreshView.as_view(), name='token_refresh'),
     path('register/', views.RegisterView.as_view()),
 
     # Project
     path('projects/', views.ProjectListCreateAPIView.as_view()),
+    path('projects/bulk/', views.ProjectBulkAPIView.as_view()),
+    path('projects/summaries/', views.ProjectSummaryListAPIView.as_view()),
     path('projects/<str:id>/', views.ProjectRetrieveUpdateDestroyAPIView.as_view()),
+    path('projects/<str:id>/events/', views.ProjectEventsAPIView.as_view()),
+    path('projects/<str:id>/summary/', views.ProjectSummaryAPIView.as_view()),
 
     # ProjectRole
     path('project-roles/', views.ProjectRoleListCreateAPIView.as_view()),
+    path('project-roles/bulk/', views.ProjectRoleBulkAPIView.as_view()),
     path('project-roles/<str:id>/', views.ProjectRoleRetrieveUpdateDestroyAPIView.as_view()),
 
     # Comment
     path('comments/', views.CommentListCreateAPIView.as_view()),
+    path('comments/bulk/', views.CommentBulkAPIView.as_view()),
     path('comments/<str:id>/', views.CommentRetrieveUpdateDestroyAPIView.as_view()),
 
 ]
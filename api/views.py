@@ -4,15 +4,14 @@ from rest_framework import views
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_simplejwt.views import (
-    TokenObtainPairView
-)
-from rest_framework_simplejwt.tokens import (
-    RefreshToken
+    TokenObtainPairView,
+    TokenRefreshView
 )
 from rest_framework import generics, permissions, filters
 
 from django_filters.rest_framework import DjangoFilterBackend
 
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (
     extend_schema, OpenApiExample, OpenApiParameter,
     OpenApiResponse
@@ -20,18 +19,32 @@ from drf_spectacular.utils import (
 
 from .serializers import *
 from .models import *
-from .custom_apiviews import CustomListCreateAPIView
+from .custom_apiviews import (
+    CustomListCreateAPIView,
+    CustomRetrieveUpdateDestroyAPIView,
+    BulkAPIView,
+    EventStreamAPIView,
+)
+from .authorization import get_project_roles
+from .filters import ProjectSummaryFilter
 from .permissions import *
+from .search import FullTextSearchFilter
+from .tokens import CustomRefreshToken
 
 
 UserModel = get_user_model()
 
+BULK_DELETE_REQUEST = {
+    'application/json': {'type': 'array', 'items': {'type': 'string', 'format': 'uuid'}}
+}
+
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     """
     Added Userinfo object in response
     """
     serializer_class = CustomTokenObtainPairSerializer
+    query_budget = 3
     @extend_schema(
         request={
             'application/json': {
@@ -55,10 +68,19 @@ class CustomTokenObtainPairView(TokenObtainPairView):
         return super().post(request, *args, **kwargs)
 
 
+class CustomTokenRefreshView(TokenRefreshView):
+    """
+    Added Userinfo object in response
+    """
+    serializer_class = CustomTokenRefreshSerializer
+    query_budget = 2
+
+
 class RegisterView(views.APIView):
     """
     Register a user
     """
+    query_budget = 6
     @extend_schema(
         request={
             'application/json': CreateUserSerializer
@@ -79,7 +101,7 @@ class RegisterView(views.APIView):
 
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = CustomRefreshToken.for_user(user)
             return Response({
                 'access': str(refresh.access_token),
                 'refresh': str(refresh)
@@ -90,8 +112,11 @@ class RegisterView(views.APIView):
 
 class ProjectListCreateAPIView(CustomListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = {'GET': 4, 'POST': 10}
+    compact_serializer_class = ProjectCompactSerializer
+    cache_dependencies = (Project, UserModel)
 
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     
     search_fields = ['name', 'description', 'created_by__first_name', 'created_by__last_name',
                      'created_by__email', 'created_at', 'updated_at']
@@ -121,7 +146,7 @@ class ProjectListCreateAPIView(CustomListCreateAPIView):
             return ProjectCreateOrUpdateSerializer
     
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
+        serializer.save(created_by_id=self.request.user.id)
     
     
     @extend_schema(
@@ -129,9 +154,50 @@ class ProjectListCreateAPIView(CustomListCreateAPIView):
         parameters=[
             OpenApiParameter(
                 name='disablePagination',
-                description='Set to true to disable pagination and return all results',
+                description='Set to true to disable pagination and stream all results',
                 required=False,
                 type=bool
+            ),
+            OpenApiParameter(
+                name='streamFormat',
+                description='Format of the unpaginated stream: json (array, default) or ndjson',
+                required=False,
+                type=str,
+                enum=['json', 'ndjson']
+            ),
+            OpenApiParameter(
+                name='compact',
+                description='Set to true to return related projects/users as ids with an `included` side-table',
+                required=False,
+                type=bool
+            ),
+            OpenApiParameter(
+                name='cursorPagination',
+                description='Set to true to use keyset (cursor) pagination. Responses have no count; follow the '
+                            'next/previous links. Only `ordering` by created_at or updated_at is allowed',
+                required=False,
+                type=bool
+            ),
+            OpenApiParameter(
+                name='since',
+                description='Return only the rows changed after this token (empty for a first sync), '
+                            'with soft deleted rows as ids in `deleted`, the `since` token of the next sync '
+                            'and whether `more` rows are waiting',
+                required=False,
+                type=str
+            ),
+            OpenApiParameter(
+                name='fields',
+                description='Comma separated fields to return; nested objects are returned as ids '
+                            'unless listed in `expand`',
+                required=False,
+                type=str
+            ),
+            OpenApiParameter(
+                name='expand',
+                description='Comma separated relations to return as nested objects',
+                required=False,
+                type=str
             )
         ]
     )
@@ -144,11 +210,13 @@ class ProjectListCreateAPIView(CustomListCreateAPIView):
 
 
 
-class ProjectRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ProjectRetrieveUpdateDestroyAPIView(CustomRetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, IsProjectOwnerOrReadOnly]
-    queryset = Project.visible_objects.all()
+    query_budget = {'GET': 3, 'PUT': 24, 'DELETE': 16}
+    queryset = Project.visible_objects.select_related('created_by')
     http_method_names = ['get', 'put', 'delete']
     lookup_url_kwarg = 'id'
+    etag_fields = ('updated_at', 'created_by__updated_at')
 
     def get_serializer_class(self):
         method = self.request.method
@@ -175,10 +243,107 @@ class ProjectRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView)
 
 
 
+class ProjectEventsAPIView(EventStreamAPIView):
+    """
+    Server-Sent Events stream of the comment and project role changes of a project
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 2
+    queryset = Project.visible_objects.only('id')
+    lookup_url_kwarg = 'id'
+
+    def get_stream_id(self):
+        return self.get_object().pk
+
+    @extend_schema(
+        tags=['Project'],
+        parameters=[
+            OpenApiParameter(
+                name='Last-Event-ID',
+                location=OpenApiParameter.HEADER,
+                description='Resume after this event id. Events are `comment.created|updated|deleted` '
+                            'and `project_role.created|updated|deleted`; `reset` means the client should reload',
+                required=False,
+                type=str
+            ),
+            OpenApiParameter(
+                name='lastEventId',
+                description='Same as the Last-Event-ID header',
+                required=False,
+                type=str
+            ),
+        ],
+        responses={(200, 'text/event-stream'): OpenApiTypes.STR}
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+
+class ProjectSummaryAPIView(generics.RetrieveAPIView):
+    """
+    Comment count, member counts by role and last activity of a project
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 2
+    serializer_class = ProjectSummarySerializer
+    queryset = ProjectSummary.objects.filter(project__is_visible=True)
+    lookup_field = 'project'
+    lookup_url_kwarg = 'id'
+
+    @extend_schema(tags=['Project'])
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+
+class ProjectSummaryListAPIView(generics.ListAPIView):
+    """
+    Summaries of several projects, selected with `project__in`
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 3
+    serializer_class = ProjectSummarySerializer
+    queryset = ProjectSummary.objects.filter(project__is_visible=True).order_by('project')
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProjectSummaryFilter
+
+    @extend_schema(tags=['Project'])
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+
+class ProjectBulkAPIView(BulkAPIView):
+    """
+    Create, update or soft delete Project objects in batches
+    """
+    permission_classes = [permissions.IsAuthenticated, IsProjectOwnerOrReadOnly]
+    query_budget = {'POST': 14, 'PATCH': 18, 'DELETE': 18}
+    queryset = Project.visible_objects.all()
+    serializer_class = ProjectCreateOrUpdateSerializer
+    owner_field = 'created_by'
+
+    @extend_schema(tags=['Project'], request=ProjectCreateOrUpdateSerializer(many=True))
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+    @extend_schema(tags=['Project'], request=ProjectCreateOrUpdateSerializer(many=True))
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+
+    @extend_schema(tags=['Project'], request=BULK_DELETE_REQUEST)
+    def delete(self, request, *args, **kwargs):
+        return super().delete(request, *args, **kwargs)
+
+
+
 class ProjectRoleListCreateAPIView(CustomListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = {'GET': 4, 'POST': 12}
+    compact_serializer_class = ProjectRoleCompactSerializer
 
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     
     search_fields = [
         'user__first_name', 'user__last_name', 'user__email', 'project__name', 'project__description', 
@@ -202,7 +367,7 @@ class ProjectRoleListCreateAPIView(CustomListCreateAPIView):
     }
     
     def get_queryset(self):
-        return ProjectRole.visible_objects.select_related('user', 'project').order_by('-created_at')
+        return ProjectRole.visible_objects.select_related('user', 'project__created_by').order_by('-created_at')
 
     def get_serializer_class(self):
         method = self.request.method
@@ -213,16 +378,57 @@ class ProjectRoleListCreateAPIView(CustomListCreateAPIView):
             return ProjectRoleCreateOrUpdateSerializer
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
     
     @extend_schema(
         tags=['ProjectRole'],
         parameters=[
             OpenApiParameter(
                 name='disablePagination',
-                description='Set to true to disable pagination and return all results',
+                description='Set to true to disable pagination and stream all results',
+                required=False,
+                type=bool
+            ),
+            OpenApiParameter(
+                name='streamFormat',
+                description='Format of the unpaginated stream: json (array, default) or ndjson',
+                required=False,
+                type=str,
+                enum=['json', 'ndjson']
+            ),
+            OpenApiParameter(
+                name='compact',
+                description='Set to true to return related projects/users as ids with an `included` side-table',
+                required=False,
+                type=bool
+            ),
+            OpenApiParameter(
+                name='cursorPagination',
+                description='Set to true to use keyset (cursor) pagination. Responses have no count; follow the '
+                            'next/previous links. Only `ordering` by created_at or updated_at is allowed',
                 required=False,
                 type=bool
+            ),
+            OpenApiParameter(
+                name='since',
+                description='Return only the rows changed after this token (empty for a first sync), '
+                            'with soft deleted rows as ids in `deleted`, the `since` token of the next sync '
+                            'and whether `more` rows are waiting',
+                required=False,
+                type=str
+            ),
+            OpenApiParameter(
+                name='fields',
+                description='Comma separated fields to return; nested objects are returned as ids '
+                            'unless listed in `expand`',
+                required=False,
+                type=str
+            ),
+            OpenApiParameter(
+                name='expand',
+                description='Comma separated relations to return as nested objects',
+                required=False,
+                type=str
             )
         ]
     )
@@ -235,11 +441,13 @@ class ProjectRoleListCreateAPIView(CustomListCreateAPIView):
 
 
 
-class ProjectRoleRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ProjectRoleRetrieveUpdateDestroyAPIView(CustomRetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, IsProjectRoleOwnerOrReadOnly]
-    queryset = ProjectRole.visible_objects.all()
+    query_budget = {'GET': 3, 'PUT': 16, 'DELETE': 12}
+    queryset = ProjectRole.visible_objects.select_related('user', 'project__created_by')
     http_method_names = ['get', 'put', 'delete']
     lookup_url_kwarg = 'id'
+    etag_fields = ('updated_at', 'user__updated_at', 'project__updated_at', 'project__created_by__updated_at')
 
     def get_serializer_class(self):
         method = self.request.method
@@ -267,10 +475,43 @@ class ProjectRoleRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIV
 
 
 
+class ProjectRoleBulkAPIView(BulkAPIView):
+    """
+    Create, update or soft delete ProjectRole objects in batches
+    """
+    permission_classes = [permissions.IsAuthenticated, IsProjectRoleOwnerOrReadOnly]
+    query_budget = {'POST': 14, 'PATCH': 18, 'DELETE': 18}
+    queryset = ProjectRole.visible_objects.all()
+    serializer_class = ProjectRoleCreateOrUpdateSerializer
+    owner_field = 'user'
+
+    def get_related_objects(self, items):
+        related_objects = super().get_related_objects(items)
+        # one batched role lookup for the grant checks of the items
+        get_project_roles(self.request, list(related_objects['project']))
+        return related_objects
+
+    @extend_schema(tags=['ProjectRole'], request=ProjectRoleCreateOrUpdateSerializer(many=True))
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+    @extend_schema(tags=['ProjectRole'], request=ProjectRoleCreateOrUpdateSerializer(many=True))
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+
+    @extend_schema(tags=['ProjectRole'], request=BULK_DELETE_REQUEST)
+    def delete(self, request, *args, **kwargs):
+        return super().delete(request, *args, **kwargs)
+
+
+
 class CommentListCreateAPIView(CustomListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = {'GET': 4, 'POST': 12}
+    compact_serializer_class = CommentCompactSerializer
+    cache_dependencies = (Comment, Project, UserModel)
 
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     
     search_fields = [
         'project__name', 'project__description', 'user__first_name', 'user__last_name',
@@ -294,7 +535,7 @@ class CommentListCreateAPIView(CustomListCreateAPIView):
     }
     
     def get_queryset(self):
-        return Comment.visible_objects.select_related('user', 'project').order_by('-created_at')
+        return Comment.visible_objects.select_related('user', 'project__created_by').order_by('-created_at')
 
     def get_serializer_class(self):
         method = self.request.method
@@ -305,16 +546,57 @@ class CommentListCreateAPIView(CustomListCreateAPIView):
             return CommentCreateOrUpdateSerializer
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
     
     @extend_schema(
         tags=['Comment'],
         parameters=[
             OpenApiParameter(
                 name='disablePagination',
-                description='Set to true to disable pagination and return all results',
+                description='Set to true to disable pagination and stream all results',
                 required=False,
                 type=bool
+            ),
+            OpenApiParameter(
+                name='streamFormat',
+                description='Format of the unpaginated stream: json (array, default) or ndjson',
+                required=False,
+                type=str,
+                enum=['json', 'ndjson']
+            ),
+            OpenApiParameter(
+                name='compact',
+                description='Set to true to return related projects/users as ids with an `included` side-table',
+                required=False,
+                type=bool
+            ),
+            OpenApiParameter(
+                name='cursorPagination',
+                description='Set to true to use keyset (cursor) pagination. Responses have no count; follow the '
+                            'next/previous links. Only `ordering` by created_at or updated_at is allowed',
+                required=False,
+                type=bool
+            ),
+            OpenApiParameter(
+                name='since',
+                description='Return only the rows changed after this token (empty for a first sync), '
+                            'with soft deleted rows as ids in `deleted`, the `since` token of the next sync '
+                            'and whether `more` rows are waiting',
+                required=False,
+                type=str
+            ),
+            OpenApiParameter(
+                name='fields',
+                description='Comma separated fields to return; nested objects are returned as ids '
+                            'unless listed in `expand`',
+                required=False,
+                type=str
+            ),
+            OpenApiParameter(
+                name='expand',
+                description='Comma separated relations to return as nested objects',
+                required=False,
+                type=str
             )
         ]
     )
@@ -327,11 +609,13 @@ class CommentListCreateAPIView(CustomListCreateAPIView):
 
 
 
-class CommentRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class CommentRetrieveUpdateDestroyAPIView(CustomRetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, IsCommentOwnerOrReadOnly]
-    queryset = Comment.visible_objects.all()
+    query_budget = {'GET': 3, 'PUT': 14, 'DELETE': 12}
+    queryset = Comment.visible_objects.select_related('user', 'project__created_by')
     http_method_names = ['get', 'put', 'delete']
     lookup_url_kwarg = 'id'
+    etag_fields = ('updated_at', 'user__updated_at', 'project__updated_at', 'project__created_by__updated_at')
 
     def get_serializer_class(self):
         method = self.request.method
@@ -356,3 +640,26 @@ class CommentRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView)
     def delete(self, request, *args, **kwargs):
         return super().delete(request, *args, **kwargs)
 
+
+
+class CommentBulkAPIView(BulkAPIView):
+    """
+    Create, update or soft delete Comment objects in batches
+    """
+    permission_classes = [permissions.IsAuthenticated, IsCommentOwnerOrReadOnly]
+    query_budget = {'POST': 14, 'PATCH': 18, 'DELETE': 18}
+    queryset = Comment.visible_objects.all()
+    serializer_class = CommentCreateOrUpdateSerializer
+    owner_field = 'user'
+
+    @extend_schema(tags=['Comment'], request=CommentCreateOrUpdateSerializer(many=True))
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+    @extend_schema(tags=['Comment'], request=CommentCreateOrUpdateSerializer(many=True))
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+
+    @extend_schema(tags=['Comment'], request=BULK_DELETE_REQUEST)
+    def delete(self, request, *args, **kwargs):
+        return super().delete(request, *args, **kwargs)
@@ -7,11 +7,13 @@ from django.conf import settings
 from rest_framework import permissions
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
-    TokenRefreshView,
     TokenVerifyView
 )
 
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from drf_spectacular.views import SpectacularSwaggerView, SpectacularRedocView
+
+from api.metrics import metrics_view
+from api.schema import schema_view
 
 
 urlpatterns = [
@@ -21,11 +23,13 @@ urlpatterns = [
     path('api/v1/', include('api.urls')),
 
     # simple jwt
-    path('api/v1/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/v1/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
 
     # swagger
-    path('api/v1/schema/', SpectacularAPIView.as_view(), name='schema'),
+    path('api/v1/schema/', schema_view, name='schema'),
+
+    # prometheus
+    path('metrics', metrics_view, name='metrics'),
 
 ]
 